@@ -16,7 +16,7 @@ from flask import redirect
 from flask import request
 from json import JSONEncoder
 from hashlib import sha256
-from os import environ
+from os import environ, stat
 from urllib.parse import urlparse, quote
 from werkzeug.routing import BaseConverter
 
@@ -28,6 +28,12 @@ cache.clear() #delete the cache when the webserver is restarted
 app.jinja_env.trim_blocks = True
 app.jinja_env.lstrip_blocks = True
 
+def database_version():
+    #new releases are built in a separate file that is then renamed over clinvar.db
+    status = stat('clinvar.db')
+    return status.st_ino, status.st_mtime_ns
+
+clinvar_db_version = database_version()
 clinvar_versions = DB().dates()
 
 #it's necessary to double-escape slashes because WSGI decodes them before passing the URL to Flask
@@ -541,6 +547,15 @@ def template_functions():
         'variant_tagline': variant_tagline,
     }
 
+@app.before_request
+def reload_database():
+    global clinvar_db_version, clinvar_versions
+    version = database_version()
+    if version != clinvar_db_version:
+        clinvar_db_version = version
+        clinvar_versions = DB().dates()
+        cache.clear()
+
 @app.before_request
 def cache_get():
     response = cache.get(request.url)
@@ -1,14 +1,19 @@
 #!/usr/bin/env python3
 
+from profiler import Profiler
+
 print('Creating indexes')
 
 def create_index(cursor, table, columns):
     index = table + '__' + '__'.join(columns)
     columns = ','.join(columns)
-    cursor.execute(f'CREATE INDEX IF NOT EXISTS {index} ON {table} ({columns})')
+    #the stage's rows are left out, because counting them would take another scan of the table
+    with profiler.stage(index):
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {index} ON {table} ({columns})')
 
 db = __import__('import-clinvar-xml').connect()
 cursor = db.cursor()
+profiler = Profiler('create-indexes.py', db)
 
 submission_columns_to_index = [
     'rsid',
@@ -54,9 +59,6 @@ for column in comparison_columns_to_index:
 create_index(cursor, 'mondo_clinvar_relationships', ['mondo_id'])
 
 
-date = list(cursor.execute('SELECT MAX(date) FROM submissions'))[0][0]
-
-
 print('Creating gene links table')
 
 def create_gene_links_table(normalized):
@@ -69,27 +71,54 @@ def create_gene_links_table(normalized):
         gene_column = 'gene'
         type_column = 'gene_type'
 
-    cursor.execute('DROP TABLE IF EXISTS ' + table)
-
-    cursor.execute('CREATE TABLE ' + table + ' (gene TEXT, see_also TEXT)')
-
-    query = 'SELECT DISTINCT ' + gene_column + ' FROM submissions WHERE ' + type_column + '=2 AND date=?'
-    gene_combinations = list(map(lambda row: row[0], cursor.execute(query, [date])))
-
-    query = 'SELECT 1 FROM submissions WHERE ' + gene_column + '=? AND date=?'
-    for gene_combination in gene_combinations:
-        for individual_gene in gene_combination.split(', '):
-            is_gene = bool(list(cursor.execute(query, [individual_gene, date])))
-            if is_gene:
-                cursor.executemany(
-                    'INSERT INTO ' + table + ' VALUES (?,?)',
-                    [[gene_combination, individual_gene], [individual_gene, gene_combination]]
-                )
-
-    cursor.execute('CREATE INDEX ' + table + '__gene ON ' + table + ' (gene)')
+    with profiler.stage(table) as stage:
+        cursor.execute('DROP TABLE IF EXISTS ' + table)
+        cursor.execute('DROP TABLE IF EXISTS temp.individual_gene_links')
+
+        cursor.execute('CREATE TABLE ' + table + ' (date TEXT, gene TEXT, see_also TEXT)')
+        cursor.execute(
+            'CREATE TEMP TABLE individual_gene_links (date TEXT, gene_combination TEXT, individual_gene TEXT)'
+        )
+
+        #split every combination of genes in every release into its individual genes and keep the individual genes that
+        #have submissions of their own in the same release, all in one query that can use the date and gene index
+        cursor.execute('''
+            WITH RECURSIVE split(date, gene_combination, individual_gene, rest) AS (
+                SELECT DISTINCT date, ''' + gene_column + ''', '', ''' + gene_column + ''' || ', ' FROM submissions
+                WHERE ''' + type_column + '''=2
+                UNION ALL
+                SELECT
+                    date,
+                    gene_combination,
+                    substr(rest, 1, instr(rest, ', ') - 1),
+                    substr(rest, instr(rest, ', ') + 2)
+                FROM split WHERE rest!=''
+            )
+            INSERT INTO individual_gene_links
+            SELECT date, gene_combination, individual_gene FROM split
+            WHERE individual_gene!='' AND EXISTS (
+                SELECT 1 FROM submissions WHERE date=split.date AND ''' + gene_column + '''=split.individual_gene
+            )
+        ''')
+        stage.rows_in = list(cursor.execute('SELECT COUNT(*) FROM individual_gene_links'))[0][0]
+
+        #link each combination to its genes and each gene to its combinations
+        cursor.execute('''
+            INSERT INTO ''' + table + '''
+            SELECT date, gene_combination, individual_gene FROM individual_gene_links
+            UNION ALL
+            SELECT date, individual_gene, gene_combination FROM individual_gene_links
+            ORDER BY 1, 2, 3
+        ''')
+        stage.rows_out = 2 * stage.rows_in
+
+        cursor.execute('DROP TABLE individual_gene_links')
+        cursor.execute('CREATE INDEX ' + table + '__date__gene ON ' + table + ' (date, gene)')
 
 create_gene_links_table(True)
 create_gene_links_table(False)
 
 db.commit()
+profiler.report()
+profiler.save(db)
 db.close()
@@ -109,14 +109,11 @@ class DB():
         except IndexError:
             ret = {'name': gene, 'type': 0}
 
-        if not date or date == self.max_date():
-            if original_genes:
-                query = 'SELECT see_also FROM gene_links WHERE gene=?'
-            else:
-                query = 'SELECT see_also FROM normalized_gene_links WHERE gene=?'
-            ret['see_also'] = list(map(lambda row: row[0], self.cursor.execute(query, [gene])))
+        if original_genes:
+            query = 'SELECT see_also FROM gene_links WHERE date=? AND gene=?'
         else:
-            ret['see_also'] = []
+            query = 'SELECT see_also FROM normalized_gene_links WHERE date=? AND gene=?'
+        ret['see_also'] = list(map(lambda row: row[0], self.cursor.execute(query, [date or self.max_date(), gene])))
 
         return ret
 
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+#import every December release from past years and every release from this year that isn't already in the database,
+#downloading the next releases while the current ones are imported
+
+from argparse import ArgumentParser
+from datetime import date
+from itertools import chain
+from os import remove, rename
+from os.path import exists, join
+from queue import Queue
+from shutil import copyfileobj
+from sys import exit
+from threading import Thread
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+importer = __import__('import-clinvar-xml')
+
+base_url = 'https://ftp.ncbi.nlm.nih.gov/pub/clinvar/xml/RCV_xml_old_format/'
+
+def get_releases():
+    #only the December release from past years, and every month's release from the current year
+    today = date.today()
+    releases = list(map(lambda year: (year, 12), range(2012, today.year)))
+    releases += list(map(lambda month: (today.year, month), range(1, today.month + 1)))
+    return releases
+
+def get_imported_months():
+    #a release that was interrupted partway through has to be imported again
+    db = importer.connect()
+    importer.create_tables()
+    dates = set(map(lambda row: row[0], db.execute('SELECT DISTINCT date FROM submissions')))
+    dates -= set(map(lambda row: row[0], db.execute(
+        'SELECT date FROM import_progress GROUP BY date HAVING COUNT(*)<?', [len(importer.import_stages)]
+    )))
+    db.close()
+    return set(map(lambda release_date: release_date[:len('YYYY-MM')], dates))
+
+def download(url, filename):
+    try:
+        response = urlopen(url)
+    except HTTPError as error:
+        if error.code == 404:
+            return False
+        raise
+    print('Downloading ' + url)
+    with response, open(filename + '.part', 'wb') as f:
+        copyfileobj(response, f, importer.block_size)
+    rename(filename + '.part', filename)
+    return True
+
+def fetch_release(year, month, mirror):
+    #returns the filename of the release, or None if there isn't a release for that month
+    filename = f'ClinVarFullRelease_{year}-{month:02}.xml.gz'
+    if mirror:
+        filename = join(mirror, filename)
+        return filename if exists(filename) else None
+    #try downloading from the root directory first, then from the archive directory
+    for url in [base_url + filename, base_url + f'archive/{year}/' + filename]:
+        if download(url, filename):
+            return filename
+    return None
+
+def fetch_releases(releases, mirror, fetched):
+    try:
+        for year, month in releases:
+            filename = fetch_release(year, month, mirror)
+            if filename:
+                fetched.put(filename)
+        fetched.put(None)
+    except BaseException as error:
+        fetched.put(error)
+
+def get_fetched_releases(fetched):
+    while True:
+        filename = fetched.get()
+        if filename == None:
+            return
+        if isinstance(filename, BaseException):
+            raise filename
+        yield filename
+
+parser = ArgumentParser(
+    description='Import the ClinVar releases that are missing from clinvar.db (or the database named by $CLINVAR_DB)'
+)
+parser.add_argument(
+    '--mirror', metavar='DIR',
+    help='read the releases from ClinVarFullRelease_<year>-<month>.xml.gz files in DIR instead of downloading them'
+)
+parser.add_argument(
+    '--jobs', type=int, default=4, metavar='N', help='number of releases to import at the same time (default: 4)'
+)
+parser.add_argument(
+    '--prefetch', type=int, default=2, metavar='N',
+    help='number of downloaded releases that may be waiting to be imported (default: 2)'
+)
+parser.add_argument(
+    '--save-parsed', metavar='DIR', dest='parsed_dir', default='parsed-releases',
+    help='where to save the fields parsed from each release (default: parsed-releases)'
+)
+args = parser.parse_args()
+
+imported_months = get_imported_months()
+releases = list(filter(lambda release: f'{release[0]}-{release[1]:02}' not in imported_months, get_releases()))
+print('Looking for ' + ', '.join(map(lambda release: f'{release[0]}-{release[1]:02}', releases)))
+
+#the downloads are decompressed as they're imported, by pigz if it's installed
+fetched = Queue(args.prefetch)
+fetcher = Thread(target=fetch_releases, args=(releases, args.mirror, fetched), daemon=True)
+fetcher.start()
+
+def remove_download(filename):
+    if not args.mirror:
+        remove(filename)
+
+#don't drop and recreate the indexes unless there's something to import
+filenames = get_fetched_releases(fetched)
+first_filename = next(filenames, None)
+if not first_filename:
+    print('No new releases to import')
+    exit()
+
+importer.extractor = 'events'
+index_definitions = importer.start_bulk_load()
+importer.import_files_in_parallel(
+    chain([first_filename], filenames), args.jobs, importer.default_memory_budget, importer.default_batch_size, None,
+    True, args.parsed_dir, None, remove_download
+)
+importer.finish_bulk_load(index_definitions)
@@ -1,31 +1,61 @@
 #!/usr/bin/env python3
 
+from argparse import ArgumentParser
+from array import array
+from collections import deque
+from contextlib import contextmanager
 from copy import copy
-from functools import partial
-from mmap import mmap
+from functools import lru_cache, partial
+from gzip import GzipFile
+from hashlib import blake2b
+from itertools import groupby, islice
 from mondo import Mondo
-from multiprocessing import Pool
-from os.path import getsize
-from psutil import virtual_memory
+from multiprocessing import Pool, Process, cpu_count
+from multiprocessing.connection import wait
+from operator import itemgetter
+from os import environ, fsync, getpid, makedirs, remove, rename
+from os.path import exists, join
+from profiler import Profiler, create_profile_table, get_memory_used
+from psutil import Process as ProcessInfo, virtual_memory
 from pycountry import countries
-from sys import argv
-from xml.etree import ElementTree
+from shutil import copyfileobj, which
+from subprocess import CalledProcessError, PIPE, Popen
+from sys import exit, stdin
+from threading import Condition, Event, Thread
+from time import perf_counter
+from xml.parsers import expat
 import csv
+import gc
+import pickle
 import re
 import sqlite3
+import xmlbackend
 
 nonstandard_significance_term_map = dict(map(
     lambda line: line[0:-1].split('\t'),
     open('nonstandard_significance_terms.tsv')
 ))
 
-submitter_country_codes = dict(map(
-    lambda row: (int(row[0]), row[2]),
+def get_country_name(country_code):
+    if not country_code:
+        return ''
+    country = countries.get(alpha_3=country_code)
+    return country.common_name if hasattr(country, 'common_name') else country.name
+
+#look each submitter's country up once here instead of once per submission
+submitter_countries = dict(map(
+    lambda row: (int(row[0]), (row[2], get_country_name(row[2]))),
     csv.reader(open('submitter_info.tsv', 'r'), delimiter='\t')
 ))
 
 mondo = Mondo()
 
+benign_significances = ['benign', 'likely benign']
+
+benign_or_uncertain_significances = benign_significances + ['uncertain significance']
+
+pathogenic_significances = ['pathogenic', 'likely pathogenic']
+
 standard_methods = [
     'clinical testing',
     'curation',
@@ -33,8 +63,93 @@ standard_methods = [
     'research',
 ]
 
-def connect():
-    return sqlite3.connect('clinvar.db', timeout=600)
+antisense_gene_regex = re.compile('.+-AS[1-9]?')
+
+#how much of the XML file to read at a time
+block_size = 16 * 1024 * 1024
+
+#how many megabytes of ClinVarSet XML may be waiting to be parsed or written at once
+default_memory_budget = 1024
+
+#how many submissions to insert per transaction
+default_batch_size = 50000
+
+#how many bytes are in a ClinVarSet digest
+digest_size = 16
+
+#the columns of a parsed release: the fields of extract_clinvarset's result and then the fields of each of its
+#assertions, each with the array typecode to store it as, or None to store each distinct value only once
+clinvarset_columns = [
+    ('rcv', 'q'),
+    ('variant_id', 'q'),
+    ('variant_name', None),
+    ('variant_frequency', 'd'),
+    ('rsid', 'q'),
+    ('genes', None),
+    ('small_variant', 'B'),
+    ('condition_name', None),
+    ('condition_xrefs', None),
+]
+assertion_columns = [
+    ('scv', 'q'),
+    ('submitter_id', 'q'),
+    ('submitter_name', None),
+    ('significance', None),
+    ('last_eval', None),
+    ('review_status', None),
+    ('method', None),
+    ('comment', None),
+]
+parsed_release_format = 'ClinVarParsedRelease 2'
+
+#how many ClinVarSets to store per row group of a parsed release
+row_group_size = 65536
+
+#the most ClinVarSets to send to a worker process at a time
+chunk_size = 64
+
+#roughly how many bytes a ClinVarSet takes up from being read until its submissions are written, including its parse
+#tree and results
+clinvarset_memory = 256 * 1024
+
+#how many seconds to wait between checks of the memory that the import is using, and how long to wait after changing
+#how many workers run before letting one more run
+memory_check_interval = 1
+worker_increase_delay = 10
+
+#how to find the fields of each ClinVarSet, see extractors
+extractor = 'tree'
+
+#the stages of importing a release, in order; an import that was interrupted starts again from the first stage that
+#it didn't finish
+import_stages = ['submissions', 'mondo_fixes', 'comparisons', 'normalized_conflict_levels', 'relationships']
+
+#what the tree extractor parses ClinVarSets with: lxml if it's installed, or else ElementTree
+xml_backend = xmlbackend.default_backend
+
+#build into another file, such as a staging copy that is renamed over clinvar.db once it's ready
+database = environ.get('CLINVAR_DB', 'clinvar.db')
+
+#the most memory that SQLite may cache pages in while bulk loading, and the fraction of the memory budget that it may
+#take if that's less
+max_bulk_load_cache_size = 2 * 1024 * 1024 * 1024
+bulk_load_cache_share = 1 / 4
+
+def get_bulk_load_cache_size(rss_budget):
+    #in bytes, like rss_budget
+    return min(max_bulk_load_cache_size, int(rss_budget * bulk_load_cache_share))
+
+def connect(bulk_load=False, rss_budget=None):
+    db = sqlite3.connect(database, timeout=600)
+    if bulk_load:
+        #trade crash safety for speed, finish_bulk_load checks the database before it can be used; the rollback journal
+        #stays on disk, though, so that an import whose process is killed, such as by running out of memory, is rolled
+        #back to the last finished stage instead of corrupting the database
+        db.execute('PRAGMA synchronous=OFF')
+        db.execute('PRAGMA journal_mode=TRUNCATE')
+        cache_size = get_bulk_load_cache_size(rss_budget or get_default_rss_budget() * 1024 * 1024)
+        db.execute(f'PRAGMA cache_size=-{cache_size // 1024}')
+    return db
 
 def create_tables():
     db = connect()
@@ -119,6 +234,32 @@ def create_tables():
         )
     ''')
 
+    #fingerprints of every ClinVarSet so that the next release can be imported incrementally, along with each
+    #submission's primary Mondo xref before it was reconciled with the other submissions of the same variant and the
+    #position of the ClinVarSet in the release, because the last ClinVarSet wins when an SCV is in more than one
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS clinvarset_digests (
+            date TEXT,
+            digest BLOB,
+            scv INTEGER,
+            primary_mondo_xref TEXT,
+            ordinal INTEGER,
+            PRIMARY KEY (date, digest, scv)
+        )
+    ''')
+    if 'ordinal' not in table_columns(cursor, 'clinvarset_digests'):
+        #the releases imported before the positions were kept can't be the base of an incremental import
+        cursor.execute('ALTER TABLE clinvarset_digests ADD COLUMN ordinal INTEGER')
+
+    #variants whose submissions changed since the previous release during an incremental import
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS changed_variants (
+            date TEXT,
+            variant_name TEXT,
+            PRIMARY KEY (date, variant_name)
+        )
+    ''')
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS mondo_clinvar_relationships (
             date TEXT,
@@ -129,6 +270,20 @@ def create_tables():
         )
     ''')
 
+    #the stages of each release's import that have finished, see import_stages, and the release that a delta import
+    #copied unchanged ClinVarSets from
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS import_progress (
+            date TEXT,
+            stage TEXT,
+            previous_date TEXT,
+            PRIMARY KEY (date, stage)
+        )
+    ''')
+
+    #indexes that a bulk load dropped and hasn't recreated yet
+    cursor.execute('CREATE TABLE IF NOT EXISTS dropped_indexes (sql TEXT PRIMARY KEY)')
+
 def get_gene_type(genes, small_variant):
     if len(genes) == 0:
         return 0 #intergenic
@@ -139,37 +294,70 @@ def get_gene_type(genes, small_variant):
     else:
         return 3 #multiple genes because variant is large
 
-def get_submissions(date, set_xml):
-    set_el = ElementTree.fromstring(set_xml)
-    submissions = []
+#each worker process remembers the genes that it has normalized because the same genes come up over and over
+@lru_cache(maxsize=None)
+def normalize_gene(gene):
+    #count antisense RNA genes as the gene that they overlap
+    return gene.rpartition('-')[0] if antisense_gene_regex.fullmatch(gene) else gene
+
+def get_condition_xrefs(trait_xref_attribs):
+    condition_xrefs = set()
+    for trait_xref_attrib in trait_xref_attribs:
+        if trait_xref_attrib.get('Type') == 'secondary' or 'ID' not in trait_xref_attrib:
+            continue
+        condition_db = trait_xref_attrib['DB'].lower()
+        condition_id = trait_xref_attrib['ID']
+        #check for the most popular databases first
+        if condition_db == 'medgen':
+            condition_xrefs.add('UMLS:' + condition_id)
+        elif condition_db == 'omim':
+            condition_xrefs.add('OMIM:' + condition_id)
+        elif condition_db == 'orphanet':
+            condition_xrefs.add('ORPHANET:' + condition_id)
+        elif condition_db == 'human phenotype ontology':
+            condition_xrefs.add(condition_id) #already starts with 'HP:'
+        elif condition_db == 'snomed ct':
+            condition_xrefs.add('SNOMEDCT_US:' + condition_id)
+        elif condition_db == 'mesh':
+            condition_xrefs.add('MESH:' + condition_id)
+        elif condition_db == 'uniprotkb/swiss-prot':
+            condition_xrefs.add('UNIPROT:' + condition_id)
+        elif condition_db == 'efo':
+            condition_xrefs.add('EFO:' + condition_id)
+    return condition_xrefs
+
+def extract_clinvarset(set_xml):
+    #pull out the fields exactly as ClinVar reports them; everything that depends on our own lookup tables is left
+    #to derive_submissions so that it can be redone from a parsed release without the XML
+    set_el = xml_backend.fromstring(set_xml)
 
-    reference_assertion_el = set_el.find('./ReferenceClinVarAssertion')
-    rcv = int(reference_assertion_el.find('./ClinVarAccession[@Type="RCV"]').attrib['Acc'][3:])
+    reference_assertion_el = xml_backend.find(set_el, './ReferenceClinVarAssertion')
+    rcv = int(xml_backend.find(reference_assertion_el, './ClinVarAccession[@Type="RCV"]').attrib['Acc'][3:])
 
-    measure_set_el = reference_assertion_el.find('./MeasureSet')
-    genotype_set_el = reference_assertion_el.find('./GenotypeSet')
+    measure_set_el = xml_backend.find(reference_assertion_el, './MeasureSet')
+    genotype_set_el = xml_backend.find(reference_assertion_el, './GenotypeSet')
 
     if genotype_set_el != None:
         variant_id = 0
-        variant_name_el = genotype_set_el.find('./Name/ElementValue[@Type="Preferred"]')
-        measure_els = genotype_set_el.findall('./MeasureSet/Measure')
+        variant_name_el = xml_backend.find(genotype_set_el, './Name/ElementValue[@Type="Preferred"]')
+        measure_els = xml_backend.findall(genotype_set_el, './MeasureSet/Measure')
     else:
         variant_id = int(measure_set_el.attrib['ID'])
-        variant_name_el = measure_set_el.find('./Name/ElementValue[@Type="Preferred"]')
-        measure_els = measure_set_el.findall('./Measure')
+        variant_name_el = xml_backend.find(measure_set_el, './Name/ElementValue[@Type="Preferred"]')
+        measure_els = xml_backend.findall(measure_set_el, './Measure')
 
     variant_name = variant_name_el.text if variant_name_el != None else str(variant_id) #missing in old versions
 
     rsid = 0
     variant_frequency = 0
     if len(measure_els) == 1:
-        rsid_el = measure_els[0].find('./XRef[@Type="rs"]')
+        rsid_el = xml_backend.find(measure_els[0], './XRef[@Type="rs"]')
         if rsid_el != None:
             rsid = int(rsid_el.attrib['ID'])
 
-        allele_frequency_el = measure_els[0].find('./AlleleFrequencyList/AlleleFrequency[@Source="The Genome Aggregation Database (gnomAD)"]')
+        allele_frequency_el = xml_backend.find(measure_els[0], './AlleleFrequencyList/AlleleFrequency[@Source="The Genome Aggregation Database (gnomAD)"]')
         if allele_frequency_el == None:
-            allele_frequency_el = measure_els[0].find('./AlleleFrequencyList/AlleleFrequency[@Source="The Genome Aggregation Database (gnomAD), exomes"]')
+            allele_frequency_el = xml_backend.find(measure_els[0], './AlleleFrequencyList/AlleleFrequency[@Source="The Genome Aggregation Database (gnomAD), exomes"]')
         if allele_frequency_el != None:
             variant_frequency = float(allele_frequency_el.attrib['Value'])
 
@@ -181,11 +369,11 @@ def get_submissions(date, set_xml):
     for i, measure_el in enumerate(measure_els):
         #loop through each gene associated with the variant
         variant_genes = set()
-        for relationship_el in measure_el.findall('./MeasureRelationship'):
+        for relationship_el in xml_backend.findall(measure_el, './MeasureRelationship'):
             if relationship_el.attrib['Type'] == 'genes overlapped by variant':
                 small_variant = False #probably a large deletion
 
-            gene_el = relationship_el.find('./Symbol/ElementValue[@Type="Preferred"]')
+            gene_el = xml_backend.find(relationship_el, './Symbol/ElementValue[@Type="Preferred"]')
             if gene_el != None and gene_el.text: #blank in old versions
                 variant_genes.add(gene_el.text)
 
@@ -197,79 +385,354 @@ def get_submissions(date, set_xml):
 
         genes |= variant_genes
 
-    gene = ', '.join(sorted(genes))
-    gene_type = get_gene_type(genes, small_variant)
-
-    genes = set(map(lambda gene: gene.rpartition('-')[0] if re.fullmatch('.+-AS[1-9]?', gene) else gene, genes))
-    normalized_gene = ', '.join(sorted(genes))
-    normalized_gene_type = get_gene_type(genes, small_variant)
-
-    trait_name_els = reference_assertion_el.findall('./TraitSet/Trait/Name/ElementValue[@Type="Preferred"]')
+    trait_name_els = xml_backend.findall(
+        reference_assertion_el, './TraitSet/Trait/Name/ElementValue[@Type="Preferred"]'
+    )
     if trait_name_els:
         condition_name = '; '.join(map(lambda el: el.text, trait_name_els))
     else:
         condition_name = 'not specified'
 
-    condition_xrefs = set()
-    for trait_xref_el in reference_assertion_el.findall('./TraitSet/Trait//XRef'):
-        if trait_xref_el.attrib.get('Type') == 'secondary' or 'ID' not in trait_xref_el.attrib:
-            continue
-        condition_db = trait_xref_el.attrib['DB'].lower()
-        condition_id = trait_xref_el.attrib['ID']
-        #check for the most popular databases first
-        if condition_db == 'medgen':
-            condition_xrefs.add('UMLS:' + condition_id)
-        elif condition_db == 'omim':
-            condition_xrefs.add('OMIM:' + condition_id)
-        elif condition_db == 'orphanet':
-            condition_xrefs.add('ORPHANET:' + condition_id)
-        elif condition_db == 'human phenotype ontology':
-            condition_xrefs.add(condition_id) #already starts with 'HP:'
-        elif condition_db == 'snomed ct':
-            condition_xrefs.add('SNOMEDCT_US:' + condition_id)
-        elif condition_db == 'mesh':
-            condition_xrefs.add('MESH:' + condition_id)
-        elif condition_db == 'uniprotkb/swiss-prot':
-            condition_xrefs.add('UNIPROT:' + condition_id)
-        elif condition_db == 'efo':
-            condition_xrefs.add('EFO:' + condition_id)
-    condition_xrefs |= mondo.most_specific_matches(condition_name, condition_xrefs)
-    condition_xrefs = ';'.join(sorted(condition_xrefs))
-
-    mondo_xrefs = list(filter(lambda ref: ref.startswith('MONDO:'), condition_xrefs.split(';')))
-    primary_mondo_xref = mondo.lowest_common_ancestor(mondo_xrefs)
-
-    for assertion_el in set_el.findall('./ClinVarAssertion'):
-        scv_el = assertion_el.find('./ClinVarAccession[@Type="SCV"]')
+    condition_xrefs = get_condition_xrefs(map(
+        lambda el: el.attrib, xml_backend.findall(reference_assertion_el, './TraitSet/Trait//XRef')
+    ))
+    assertions = []
+    for assertion_el in xml_backend.findall(set_el, './ClinVarAssertion'):
+        scv_el = xml_backend.find(assertion_el, './ClinVarAccession[@Type="SCV"]')
         scv = int(scv_el.attrib['Acc'][3:])
 
-        submission_id_el = assertion_el.find('./ClinVarSubmissionID')
-        significance_el = assertion_el.find('./ClinicalSignificance')
-        description_el = significance_el.find('./Description')
-        review_status_el = significance_el.find('./ReviewStatus')
-        method_el = assertion_el.find('./ObservedIn/Method/MethodType')
-        comment_el = significance_el.find('./Comment')
+        submission_id_el = xml_backend.find(assertion_el, './ClinVarSubmissionID')
+        significance_el = xml_backend.find(assertion_el, './ClinicalSignificance')
+        description_el = xml_backend.find(significance_el, './Description')
+        review_status_el = xml_backend.find(significance_el, './ReviewStatus')
+        method_el = xml_backend.find(assertion_el, './ObservedIn/Method/MethodType')
+        comment_el = xml_backend.find(significance_el, './Comment')
 
         submitter_id = int(scv_el.attrib['OrgID']) if scv_el.attrib.get('OrgID') else 500139 #missing in old versions
         submitter_name = submission_id_el.get('submitter', '') if submission_id_el != None else 'ClinVar Staff' #missing in old versions
-        submitter_country_code = submitter_country_codes[submitter_id] if submitter_id in submitter_country_codes else ''
-        if submitter_country_code:
-            submitter_country = countries.get(alpha_3=submitter_country_code)
-            if hasattr(submitter_country, 'common_name'):
-                submitter_country_name = submitter_country.common_name
-            else:
-                submitter_country_name = submitter_country.name
-        else:
-            submitter_country_name = ''
-
         significance = description_el.text.lower() if description_el != None else 'not provided'
-        normalized_significance = nonstandard_significance_term_map.get(significance, significance)
         last_eval = significance_el.attrib.get('DateLastEvaluated', '') #missing in old versions
         review_status = review_status_el.text if review_status_el != None else '' #missing in old versions
         method = method_el.text if method_el != None else 'not provided' #missing in old versions
-        normalized_method = method if method in standard_methods else 'other'
         comment = comment_el.text if comment_el != None else ''
 
+        assertions.append((
+            scv,
+            submitter_id,
+            submitter_name,
+            significance,
+            last_eval,
+            review_status,
+            method,
+            comment,
+        ))
+
+    return (
+        rcv,
+        variant_id,
+        variant_name,
+        variant_frequency,
+        rsid,
+        tuple(sorted(genes)),
+        small_variant,
+        condition_name,
+        tuple(sorted(condition_xrefs)),
+        assertions,
+    )
+
+class TraitContext(dict):
+    #an XRef can be anywhere below a Trait, so every tag that isn't otherwise handled is still followed
+    def get(self, tag):
+        return dict.get(self, tag, ClinVarSetEvents.start_trait_descendent)
+
+class ClinVarSetEvents:
+    #finds the same fields as extract_clinvarset in a single pass over the parser's events instead of building a tree
+    #and searching it, taking the first match wherever extract_clinvarset uses find; each context maps the tags that
+    #matter at that point in the ClinVarSet to a handler that returns the context for the element's children, and
+    #everything below an element that has no context is skipped
+    gnomad_sources = [
+        'The Genome Aggregation Database (gnomAD)',
+        'The Genome Aggregation Database (gnomAD), exomes',
+    ]
+
+    def __init__(self):
+        self.parser = expat.ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.start_element
+        self.parser.EndElementHandler = self.end_element
+        self.contexts = [self.document_context]
+        self.text_depth = 0 #depth of the element whose text is being collected, negative once it has a child
+        self.reference_assertion_count = 0
+        self.rcv_attrib = None
+        self.measure_set_count = 0
+        self.measure_set_attrib = None
+        self.genotype_set_count = 0
+        self.variant = None
+        self.variants = {}
+        self.trait_names = []
+        self.trait_xref_attribs = []
+        self.assertions = []
+
+    def parse(self, set_xml):
+        self.parser.Parse(set_xml, True)
+        return self.get_clinvarset()
+
+    def start_element(self, tag, attrib):
+        contexts = self.contexts
+        if self.text_depth > 0:
+            #ElementTree's text stops at the first child element
+            self.text_depth = -self.text_depth
+            self.parser.CharacterDataHandler = None
+        context = contexts[-1]
+        if context:
+            handler = context.get(tag)
+            contexts.append(handler(self, attrib) if handler else None)
+        else:
+            contexts.append(None)
+
+    def end_element(self, tag):
+        contexts = self.contexts
+        if self.text_depth and abs(self.text_depth) == len(contexts):
+            self.parser.CharacterDataHandler = None
+            self.text_store(''.join(self.text_parts) if self.text_parts else None)
+            self.text_depth = 0
+        contexts.pop()
+
+    def collect_text(self, store):
+        #only handle character data while it's wanted, there being far more of it between elements than in them
+        self.text_depth = len(self.contexts) + 1
+        self.text_parts = []
+        self.text_store = store
+        self.parser.CharacterDataHandler = self.text_parts.append
+
+    def enter(context):
+        return lambda self, attrib: context
+
+    def start_reference_assertion(self, attrib):
+        self.reference_assertion_count += 1
+        if self.reference_assertion_count == 1:
+            return self.reference_assertion_context
+
+    def start_rcv_accession(self, attrib):
+        if attrib.get('Type') == 'RCV' and not self.rcv_attrib:
+            self.rcv_attrib = attrib
+
+    def start_measure_set(self, attrib):
+        self.measure_set_count += 1
+        if self.measure_set_count == 1:
+            self.measure_set_attrib = attrib
+            self.variant = self.variants['MeasureSet'] = {'name_found': False, 'measures': []}
+            return self.measure_set_context
+
+    def start_genotype_set(self, attrib):
+        self.genotype_set_count += 1
+        if self.genotype_set_count == 1:
+            self.variant = self.variants['GenotypeSet'] = {'name_found': False, 'measures': []}
+            return self.genotype_set_context
+
+    def start_variant_name(self, attrib):
+        if attrib.get('Type') == 'Preferred' and not self.variant['name_found']:
+            self.variant['name_found'] = True
+            self.collect_text(partial(self.variant.__setitem__, 'name'))
+
+    def start_measure(self, attrib):
+        self.measure = {'genes': set(), 'small': True, 'frequency_attribs': {}}
+        self.variant['measures'].append(self.measure)
+        return self.measure_context
+
+    def start_measure_xref(self, attrib):
+        if attrib.get('Type') == 'rs' and 'rsid_attrib' not in self.measure:
+            self.measure['rsid_attrib'] = attrib
+
+    def start_allele_frequency(self, attrib):
+        self.measure['frequency_attribs'].setdefault(attrib.get('Source'), attrib)
+
+    def start_measure_relationship(self, attrib):
+        if attrib['Type'] == 'genes overlapped by variant':
+            self.measure['small'] = False #probably a large deletion
+        self.measure['gene_found'] = False
+        return self.measure_relationship_context
+
+    def start_gene(self, attrib):
+        if attrib.get('Type') == 'Preferred' and not self.measure['gene_found']:
+            self.measure['gene_found'] = True
+            self.collect_text(partial(self.add_gene, self.measure))
+
+    def add_gene(self, measure, gene):
+        if gene: #blank in old versions
+            measure['genes'].add(gene)
+
+    def start_trait_name(self, attrib):
+        if attrib.get('Type') == 'Preferred':
+            self.trait_names.append(None)
+            self.collect_text(partial(self.trait_names.__setitem__, len(self.trait_names) - 1))
+        return self.trait_descendent_context
+
+    def start_trait_xref(self, attrib):
+        self.trait_xref_attribs.append(attrib)
+        return self.trait_descendent_context
+
+    def start_trait_descendent(self, attrib):
+        return self.trait_descendent_context
+
+    def start_assertion(self, attrib):
+        self.assertion = {'significance_count': 0}
+        self.assertions.append(self.assertion)
+        return self.assertion_context
+
+    def start_scv_accession(self, attrib):
+        if attrib.get('Type') == 'SCV':
+            self.assertion.setdefault('scv', attrib)
+
+    def start_submission_id(self, attrib):
+        self.assertion.setdefault('submission_id', attrib)
+
+    def start_significance(self, attrib):
+        self.assertion['significance_count'] += 1
+        if self.assertion['significance_count'] == 1:
+            self.assertion['significance'] = attrib
+            return self.significance_context
+
+    def assertion_text(tag):
+        def start(self, attrib):
+            if tag not in self.assertion:
+                self.assertion[tag] = None
+                self.collect_text(partial(self.assertion.__setitem__, tag))
+        return start
+
+    document_context = {'ClinVarSet': enter({
+        'ReferenceClinVarAssertion': start_reference_assertion,
+        'ClinVarAssertion': start_assertion,
+    })}
+    reference_assertion_context = {
+        'ClinVarAccession': start_rcv_accession,
+        'MeasureSet': start_measure_set,
+        'GenotypeSet': start_genotype_set,
+        'TraitSet': enter({'Trait': enter(TraitContext({
+            'Name': enter(TraitContext({'ElementValue': start_trait_name, 'XRef': start_trait_xref})),
+            'XRef': start_trait_xref,
+        }))}),
+    }
+    variant_name_context = {'ElementValue': start_variant_name}
+    measure_set_context = {'Name': enter(variant_name_context), 'Measure': start_measure}
+    genotype_set_context = {'Name': enter(variant_name_context), 'MeasureSet': enter({'Measure': start_measure})}
+    measure_context = {
+        'XRef': start_measure_xref,
+        'AlleleFrequencyList': enter({'AlleleFrequency': start_allele_frequency}),
+        'MeasureRelationship': start_measure_relationship,
+    }
+    measure_relationship_context = {'Symbol': enter({'ElementValue': start_gene})}
+    trait_descendent_context = TraitContext({'XRef': start_trait_xref})
+    assertion_context = {
+        'ClinVarAccession': start_scv_accession,
+        'ClinVarSubmissionID': start_submission_id,
+        'ClinicalSignificance': start_significance,
+        'ObservedIn': enter({'Method': enter({'MethodType': assertion_text('MethodType')})}),
+    }
+    significance_context = {
+        'Description': assertion_text('Description'),
+        'ReviewStatus': assertion_text('ReviewStatus'),
+        'Comment': assertion_text('Comment'),
+    }
+    del enter, assertion_text
+
+    def get_clinvarset(self):
+        rcv = int(self.rcv_attrib['Acc'][3:])
+
+        if self.genotype_set_count:
+            variant_id = 0
+            variant = self.variants['GenotypeSet']
+        else:
+            variant_id = int(self.measure_set_attrib['ID'])
+            variant = self.variants['MeasureSet']
+        variant_name = variant['name'] if variant['name_found'] else str(variant_id) #missing in old versions
+        measures = variant['measures']
+
+        rsid = 0
+        variant_frequency = 0
+        if len(measures) == 1:
+            if 'rsid_attrib' in measures[0]:
+                rsid = int(measures[0]['rsid_attrib']['ID'])
+            for source in self.gnomad_sources:
+                if source in measures[0]['frequency_attribs']:
+                    variant_frequency = float(measures[0]['frequency_attribs'][source]['Value'])
+                    break
+
+        genes = set()
+        small_variant = all(map(lambda measure: measure['small'], measures))
+        #if the compound variant is small, each individual variant should be annotated with the same genes
+        for measure in measures:
+            if measure['genes'] != measures[0]['genes']:
+                small_variant = False
+            genes |= measure['genes']
+
+        condition_name = '; '.join(self.trait_names) if self.trait_names else 'not specified'
+        condition_xrefs = get_condition_xrefs(self.trait_xref_attribs)
+
+        assertions = []
+        for assertion in self.assertions:
+            scv_attrib = assertion['scv']
+            significance_attrib = assertion['significance']
+            submission_id_attrib = assertion.get('submission_id')
+            assertions.append((
+                int(scv_attrib['Acc'][3:]),
+                int(scv_attrib['OrgID']) if scv_attrib.get('OrgID') else 500139, #missing in old versions
+                submission_id_attrib.get('submitter', '') if submission_id_attrib != None else 'ClinVar Staff',
+                assertion['Description'].lower() if 'Description' in assertion else 'not provided',
+                significance_attrib.get('DateLastEvaluated', ''),
+                assertion['ReviewStatus'] if 'ReviewStatus' in assertion else '',
+                assertion['MethodType'] if 'MethodType' in assertion else 'not provided',
+                assertion['Comment'] if 'Comment' in assertion else '',
+            ))
+
+        return (
+            rcv,
+            variant_id,
+            variant_name,
+            variant_frequency,
+            rsid,
+            tuple(sorted(genes)),
+            small_variant,
+            condition_name,
+            tuple(sorted(condition_xrefs)),
+            assertions,
+        )
+
+def extract_clinvarset_events(set_xml):
+    return ClinVarSetEvents().parse(set_xml)
+
+#ways to find the fields of a ClinVarSet, which all give the same results
+extractors = {
+    'tree': extract_clinvarset,
+    'events': extract_clinvarset_events,
+}
+
+def derive_submissions(date, clinvarset):
+    (rcv, variant_id, variant_name, variant_frequency, rsid, genes, small_variant, condition_name, condition_xrefs,
+     assertions) = clinvarset
+    submissions = []
+
+    genes = set(genes)
+    gene = ', '.join(sorted(genes))
+    gene_type = get_gene_type(genes, small_variant)
+
+    genes = set(map(normalize_gene, genes))
+    normalized_gene = ', '.join(sorted(genes))
+    normalized_gene_type = get_gene_type(genes, small_variant)
+
+    condition_xrefs = set(condition_xrefs)
+    condition_xrefs |= mondo.most_specific_matches(condition_name, condition_xrefs)
+    condition_xrefs = ';'.join(sorted(condition_xrefs))
+
+    mondo_xrefs = list(filter(lambda ref: ref.startswith('MONDO:'), condition_xrefs.split(';')))
+    primary_mondo_xref = mondo.lowest_common_ancestor(mondo_xrefs)
+
+    for scv, submitter_id, submitter_name, significance, last_eval, review_status, method, comment in assertions:
+        submitter_country_code, submitter_country_name = submitter_countries.get(submitter_id, ('', ''))
+
+        normalized_significance = nonstandard_significance_term_map.get(significance, significance)
+        normalized_method = method if method in standard_methods else 'other'
+
         if review_status in ['criteria provided, single submitter', 'criteria provided, conflicting interpretations']:
             star_level = 1
         elif review_status == 'reviewed by expert panel':
@@ -310,142 +773,1121 @@ def get_submissions(date, set_xml):
 
     return submissions
 
-def import_file(filename):
-    with open(filename, 'r+b') as f:
-        doc = mmap(f.fileno(), 0)
-        for ev, el in ElementTree.iterparse(doc, events=['start']):
-            if el.tag == 'ReleaseSet':
-                date = el.attrib['Dated']
-                break
-        #hack the ClinVar XML file into pieces to parse it in parallel (if memory permits)
-        clinvarsets = re.findall(b'<ClinVarSet .+?</ClinVarSet>', doc, re.DOTALL)
-    if virtual_memory().available >= getsize(filename) * 2:
-        submission_sets = Pool().map(partial(get_submissions, date), clinvarsets)
-    else:
-        submission_sets = map(partial(get_submissions, date), clinvarsets)
-    submissions = [submission for submission_set in submission_sets for submission in submission_set]
+def get_submissions(date, set_xml):
+    return derive_submissions(date, extract_clinvarset(set_xml))
 
-    #do all the database imports at once to minimize the time that we hold the database lock
-    db = connect()
+@contextmanager
+def open_release(filename):
+    #read gzipped releases and standard input directly instead of decompressing them to disk first
+    f = stdin.buffer if filename == '-' else open(filename, 'rb')
+    try:
+        if f.peek(2)[:2] != b'\x1f\x8b':
+            yield f
+        elif which('pigz'):
+            #pigz reads, decompresses and checksums in separate threads
+            with Popen(['pigz', '-dc'], stdin=PIPE, stdout=PIPE, bufsize=block_size) as pigz:
+                def feed():
+                    try:
+                        copyfileobj(f, pigz.stdin, block_size)
+                    except BrokenPipeError:
+                        pass #stopped reading early
+                    finally:
+                        pigz.stdin.close()
+                feeder = Thread(target=feed, daemon=True)
+                feeder.start()
+                yield pigz.stdout
+                #if the release wasn't read to the end, closing the pipe lets pigz and the feeder stop
+                stopped_early = pigz.stdout.read(1) != b''
+                pigz.stdout.close()
+                feeder.join()
+            if pigz.returncode and not stopped_early:
+                raise CalledProcessError(pigz.returncode, pigz.args)
+        else:
+            with GzipFile(fileobj=f) as gz:
+                yield gz
+    finally:
+        if f is not stdin.buffer:
+            f.close()
+
+def read_release(f):
+    #find the release date in the ReleaseSet start tag without parsing the rest of the document
+    buf = b''
+    while True:
+        match = re.search(rb'<ReleaseSet\s[^>]*?Dated=(["\'])(.*?)\1', buf)
+        if match:
+            return match.group(2).decode(), read_clinvarsets(f, buf[match.end():])
+        block = f.read(block_size)
+        if not block:
+            raise ValueError('No ReleaseSet date found')
+        buf += block
+
+def read_clinvarsets(f, buf=b''):
+    #hack the ClinVar XML file into pieces one ClinVarSet at a time so that the whole file is never in memory
+    start_tag = b'<ClinVarSet '
+    end_tag = b'</ClinVarSet>'
+    pos = 0
+    while True:
+        start = buf.find(start_tag, pos)
+        if start != -1:
+            end = buf.find(end_tag, start + len(start_tag))
+            if end != -1:
+                end += len(end_tag)
+                yield buf[start:end]
+                pos = end
+                continue
+            buf = buf[start:]
+        else:
+            #keep just enough of the end of the buffer to catch a start tag split across blocks
+            buf = buf[max(pos, len(buf) - len(start_tag) + 1):]
+        pos = 0
+        block = f.read(block_size)
+        if not block:
+            return
+        buf += block
+
+def parsed_release_filename(directory, date):
+    return join(directory, 'ClinVarParsedRelease_' + date + '.pickle.gz')
+
+def encode_column(typecode, values):
+    if typecode:
+        return array(typecode, values)
+    codes = {}
+    indexes = array('L', map(lambda value: codes.setdefault(value, len(codes)), values))
+    return list(codes), indexes
+
+def decode_column(typecode, column):
+    if typecode:
+        return column
+    values, indexes = column
+    return list(map(values.__getitem__, indexes))
+
+class ParsedReleaseWriter:
+    #saves what extract_clinvarset found in a release, one column at a time, so that the release can be rederived
+    #after the lookup tables or Mondo change without downloading and parsing the XML again
+    def __init__(self, directory, date):
+        makedirs(directory, exist_ok=True)
+        self.filename = parsed_release_filename(directory, date)
+        self.file = GzipFile(self.filename + '.tmp', 'wb', compresslevel=6)
+        pickle.dump(parsed_release_format, self.file, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(date, self.file, pickle.HIGHEST_PROTOCOL)
+        self.ordinals = []
+        self.digests = []
+        self.clinvarsets = []
+
+    def write(self, ordinal, digest, clinvarset):
+        self.ordinals.append(ordinal)
+        self.digests.append(digest)
+        self.clinvarsets.append(clinvarset)
+        if len(self.clinvarsets) >= row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.clinvarsets:
+            return
+        assertions = [assertion for clinvarset in self.clinvarsets for assertion in clinvarset[-1]]
+        row_group = {
+            'ordinal': array('L', self.ordinals),
+            'digest': b''.join(self.digests),
+            'assertion_count': array('L', map(lambda clinvarset: len(clinvarset[-1]), self.clinvarsets)),
+        }
+        for i, (name, typecode) in enumerate(clinvarset_columns):
+            row_group[name] = encode_column(typecode, map(itemgetter(i), self.clinvarsets))
+        for i, (name, typecode) in enumerate(assertion_columns):
+            row_group[name] = encode_column(typecode, map(itemgetter(i), assertions))
+        pickle.dump(row_group, self.file, pickle.HIGHEST_PROTOCOL)
+        self.ordinals = []
+        self.digests = []
+        self.clinvarsets = []
+
+    def close(self):
+        #only replace an existing parsed release once the new one is complete
+        self.flush()
+        self.file.close()
+        rename(self.filename + '.tmp', self.filename)
+
+    def discard(self):
+        self.file.close()
+        if exists(self.filename + '.tmp'):
+            remove(self.filename + '.tmp')
+
+def read_parsed_release(f):
+    if pickle.load(f) not in ['ClinVarParsedRelease 1', parsed_release_format]:
+        raise ValueError('Unrecognized parsed release format')
+    return pickle.load(f), read_parsed_clinvarsets(f)
+
+def read_parsed_clinvarsets(f):
+    next_ordinal = 0
+    while True:
+        try:
+            row_group = pickle.load(f)
+        except EOFError:
+            return
+        #releases saved before the positions were kept are numbered in the order they were saved in
+        ordinals = row_group.get('ordinal', range(next_ordinal, next_ordinal + len(row_group['assertion_count'])))
+        next_ordinal += len(row_group['assertion_count'])
+        digests = row_group['digest']
+        clinvarsets = zip(*map(lambda column: decode_column(column[1], row_group[column[0]]), clinvarset_columns))
+        assertions = list(zip(*map(lambda column: decode_column(column[1], row_group[column[0]]), assertion_columns)))
+        start = 0
+        for i, (clinvarset, assertion_count) in enumerate(zip(clinvarsets, row_group['assertion_count'])):
+            digest = digests[i * digest_size:(i + 1) * digest_size]
+            yield ordinals[i], digest, clinvarset + (assertions[start:start + assertion_count],)
+            start += assertion_count
+
+def get_parsed_clinvarset_size(parsed_clinvarset):
+    #roughly how much XML the ClinVarSet took up
+    return 1024 * (1 + len(parsed_clinvarset[2][-1]))
+
+class MemoryBudget:
+    #keeps the worker pool from reading ahead faster than the writer can keep up
+    def __init__(self, max_bytes, processes, chunk_size):
+        self.max_bytes = max_bytes
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.pending_sizes = deque()
+        self.pending_bytes = 0
+        self.condition = Condition()
+        self.set_active_workers(processes)
+
+    def set_active_workers(self, active_workers):
+        #leave workers idle by handing out less work at a time, always allowing at least one whole chunk so that the
+        #pool is never left waiting for the rest of a chunk
+        with self.condition:
+            self.active_workers = active_workers
+            self.min_items = active_workers * self.chunk_size #always allow enough work to keep the active workers busy
+            if active_workers < self.processes:
+                self.max_items = 2 * active_workers * self.chunk_size
+            else:
+                self.max_items = float('inf')
+            self.condition.notify_all()
+
+    def throttle(self, items, size=len):
+        for item in items:
+            with self.condition:
+                while (
+                    self.pending_bytes > self.max_bytes and len(self.pending_sizes) >= self.min_items or
+                    len(self.pending_sizes) >= self.max_items
+                ):
+                    self.condition.wait()
+                self.pending_sizes.append(size(item))
+                self.pending_bytes += self.pending_sizes[-1]
+            yield item
+
+    def release(self):
+        #results come back in the same order that the items were handed out
+        with self.condition:
+            self.pending_bytes -= self.pending_sizes.popleft()
+            self.condition.notify()
+
+#the columns of submissions and comparisons whose values repeat often enough to be worth sending from the workers to
+#the writer as codes instead of strings
+submission_string_columns = [5, 7, 10, 11, 12, 15, 16, 17, 18, 20, 21, 22, 23, 24]
+comparison_string_columns = submission_string_columns + [27, 29, 30, 32, 33, 34]
+
+class StringEncoder:
+    #runs in each worker process, replacing strings with codes of its own and sending each string to the writer only
+    #once, along with the first rows that use it
+    def __init__(self):
+        self.codes = {}
+        self.new_strings = []
+
+    def encode_row(self, row, columns):
+        row = list(row)
+        for i in columns:
+            code = self.codes.get(row[i])
+            if code == None:
+                code = len(self.codes)
+                self.codes[row[i]] = code
+                self.new_strings.append(row[i])
+            row[i] = code
+        return row
+
+    def encode(self, rows, columns):
+        rows = list(map(lambda row: self.encode_row(row, columns), rows))
+        new_strings = self.new_strings
+        self.new_strings = []
+        return getpid(), new_strings, rows
+
+class StringDecoder:
+    #runs in the writer, mapping each worker's codes to a single copy of each string that all of the rows share
+    def __init__(self):
+        self.strings = {}
+        self.strings_by_worker = {}
+
+    def decode(self, encoded_rows, columns):
+        #the rows from each worker arrive in the order that it encoded them, so every code has been sent before it is
+        #used; a pool's workers have to be decoded by a new decoder because process IDs can be reused
+        pid, new_strings, rows = encoded_rows
+        worker_strings = self.strings_by_worker.setdefault(pid, [])
+        for string in new_strings:
+            worker_strings.append(self.strings.setdefault(string, string))
+        for row in rows:
+            for i in columns:
+                row[i] = worker_strings[row[i]]
+        return list(map(tuple, rows))
+
+#every worker process gets its own copy of this when the pool forks
+string_encoder = StringEncoder()
+
+def plan_workers(rss_budget, max_processes):
+    #assume that every worker ends up with a private copy of this process's memory, because updating the reference
+    #counts of the objects that a worker inherits copies the pages that they're on, and leave each worker enough room
+    #for two chunks of ClinVarSets
+    worker_memory = ProcessInfo().memory_info().rss
+    processes = (rss_budget - worker_memory) // (worker_memory + 2 * clinvarset_memory)
+    processes = max(1, min(max_processes, processes))
+    spare_memory = rss_budget - (processes + 1) * worker_memory
+    planned_chunk_size = max(1, min(chunk_size, spare_memory // (2 * processes * clinvarset_memory)))
+    print(
+        f'Starting {processes} workers with up to {planned_chunk_size} ClinVarSets at a time to stay within '
+        f'{rss_budget // (1024 * 1024)} MB of memory'
+    )
+    return processes, planned_chunk_size
+
+class MemoryMonitor:
+    #watches how much memory the import is using from a background thread, letting one fewer worker run at a time
+    #whenever it's over budget and one more whenever it's comfortably under budget again
+    def __init__(self, budget, rss_budget):
+        self.budget = budget
+        self.rss_budget = rss_budget
+        self.stopped = Event()
+        self.thread = Thread(target=self.watch, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def watch(self):
+        process = ProcessInfo()
+        last_change = 0
+        while not self.stopped.wait(memory_check_interval):
+            memory_used = get_memory_used(process)
+            active_workers = self.budget.active_workers
+            if memory_used > self.rss_budget and active_workers > 1:
+                active_workers -= 1
+            elif (
+                memory_used < self.rss_budget * 3 // 4 and active_workers < self.budget.processes and
+                perf_counter() - last_change > worker_increase_delay
+            ):
+                active_workers += 1
+            else:
+                continue
+            last_change = perf_counter()
+            self.budget.set_active_workers(active_workers)
+            print(
+                f'Using {memory_used // (1024 * 1024)} MB of the {self.rss_budget // (1024 * 1024)} MB memory budget, '
+                f'letting {active_workers} of {self.budget.processes} workers run'
+            )
+
+def get_digest(set_xml):
+    return blake2b(set_xml, digest_size=digest_size).digest()
+
+def get_encoded_submissions(date, clinvarset):
+    return string_encoder.encode(derive_submissions(date, clinvarset), submission_string_columns)
+
+def get_digested_submissions(date, keep_clinvarset, numbered_set_xml):
+    ordinal, set_xml = numbered_set_xml
+    clinvarset = extractors[extractor](set_xml)
+    return (
+        ordinal, get_digest(set_xml), clinvarset if keep_clinvarset else None, get_encoded_submissions(date, clinvarset)
+    )
+
+def get_rederived_submissions(date, keep_clinvarset, parsed_clinvarset):
+    ordinal, digest, clinvarset = parsed_clinvarset
+    return ordinal, digest, clinvarset if keep_clinvarset else None, get_encoded_submissions(date, clinvarset)
+
+def get_numbered_set_xml_size(numbered_set_xml):
+    return len(numbered_set_xml[1])
+
+def skip_unchanged(numbered_clinvarsets, previous_digests, unchanged_digests):
+    for ordinal, set_xml in numbered_clinvarsets:
+        digest = get_digest(set_xml)
+        if digest in previous_digests:
+            unchanged_digests.append((digest, ordinal))
+        else:
+            yield ordinal, set_xml
+
+def table_columns(cursor, table):
+    return list(map(lambda row: row[1], cursor.execute('PRAGMA table_info(' + table + ')')))
+
+def insert_submissions(db, submissions, digests, bulk_load):
+    if bulk_load:
+        #B-tree inserts are cheapest in primary key order, and stable sorts keep the last copy of a duplicate SCV last
+        submissions.sort(key=itemgetter(14))
+        digests.sort(key=itemgetter(1, 2))
+    db.executemany('INSERT OR REPLACE INTO submissions VALUES (' + ','.join('?' * 26) + ')', submissions)
+    db.executemany('INSERT OR REPLACE INTO clinvarset_digests VALUES (?,?,?,?,?)', digests)
+    db.commit()
+
+def copy_unchanged_submissions(db, date, previous_date, unchanged_digests):
     cursor = db.cursor()
 
+    #with the position of each unchanged ClinVarSet in this release
+    cursor.execute('DROP TABLE IF EXISTS temp.unchanged_digests')
+    cursor.execute('CREATE TEMP TABLE unchanged_digests (digest BLOB PRIMARY KEY, ordinal INTEGER)')
+    cursor.executemany('INSERT OR REPLACE INTO unchanged_digests VALUES (?,?)', unchanged_digests)
+
+    #variants that gained, lost or changed a submission have to be compared again
+    cursor.execute('DELETE FROM changed_variants WHERE date=?', [date])
+    for changed_date in [date, previous_date]:
+        cursor.execute('''
+            INSERT OR IGNORE INTO changed_variants
+            SELECT :date, variant_name FROM submissions WHERE date=:changed_date AND scv IN (
+                SELECT scv FROM clinvarset_digests
+                WHERE date=:changed_date AND digest NOT IN (SELECT digest FROM unchanged_digests)
+            )
+        ''', {'date': date, 'changed_date': changed_date})
+
+    #the columns that come from the lookup tables are derived again in case the tables changed since the previous
+    #release
+    cursor.execute('DROP TABLE IF EXISTS temp.submitter_countries')
+    cursor.execute(
+        'CREATE TEMP TABLE submitter_countries (submitter_id INTEGER PRIMARY KEY, country_code TEXT, country_name TEXT)'
+    )
     cursor.executemany(
-        'INSERT OR REPLACE INTO submissions VALUES (' + ','.join('?' * len(submissions[0])) + ')', submissions
+        'INSERT INTO submitter_countries VALUES (?,?,?)',
+        map(lambda item: (item[0],) + item[1], submitter_countries.items())
+    )
+    cursor.execute('DROP TABLE IF EXISTS temp.significance_terms')
+    cursor.execute(
+        'CREATE TEMP TABLE significance_terms (significance TEXT PRIMARY KEY, normalized_significance TEXT)'
     )
+    cursor.executemany(
+        'INSERT OR REPLACE INTO significance_terms VALUES (?,?)', nonstandard_significance_term_map.items()
+    )
+    derived_columns = {
+        'submitter_country_code': "IFNULL(c.country_code, '')",
+        'submitter_country_name': "IFNULL(c.country_name, '')",
+        'normalized_significance': 'IFNULL(t.normalized_significance, s.significance)',
+        'normalized_method': (
+            'CASE WHEN s.method IN (' + ', '.join(map(lambda method: "'" + method + "'", standard_methods)) + ') '
+            "THEN s.method ELSE 'other' END"
+        ),
+    }
+    unchanged_submissions = '''
+        FROM clinvarset_digests d
+        INNER JOIN unchanged_digests u ON u.digest=d.digest
+        INNER JOIN submissions s ON s.date=d.date AND s.scv=d.scv
+        LEFT JOIN submitter_countries c ON c.submitter_id=s.submitter_id
+        LEFT JOIN significance_terms t ON t.significance=s.significance
+        WHERE d.date=:previous_date
+    '''
 
-    del submissions
+    #a variant also has to be compared again if one of its submissions was derived differently this time
+    cursor.execute('''
+        INSERT OR IGNORE INTO changed_variants
+        SELECT :date, s.variant_name''' + unchanged_submissions + '''AND (
+            ''' + ' OR '.join(map(lambda item: item[1] + ' IS NOT s.' + item[0], derived_columns.items())) + '''
+        )
+    ''', {'date': date, 'previous_date': previous_date})
 
-    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__date ON submissions (date)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__variant_name ON submissions (variant_name)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__scv ON submissions (scv)')
+    #if the same SCV is in both a freshly parsed ClinVarSet and an unchanged one, the later ClinVarSet wins, the same
+    #as when the whole release is imported
+    cursor.execute('DROP TABLE IF EXISTS temp.parsed_scvs')
+    cursor.execute('''
+        CREATE TEMP TABLE parsed_scvs AS
+        SELECT scv, MAX(ordinal) AS ordinal FROM clinvarset_digests WHERE date=? GROUP BY scv
+    ''', [date])
+    cursor.execute('CREATE UNIQUE INDEX temp.parsed_scvs_scv ON parsed_scvs (scv)')
+    columns = table_columns(cursor, 'submissions')
+    overrides = dict(derived_columns, date=':date', primary_mondo_xref='d.primary_mondo_xref')
+    cursor.execute(
+        'INSERT OR REPLACE INTO submissions SELECT ' +
+        ', '.join(map(lambda column: overrides.get(column, 's.' + column), columns)) + unchanged_submissions +
+        'AND NOT EXISTS (SELECT 1 FROM parsed_scvs p WHERE p.scv=d.scv AND p.ordinal>u.ordinal)',
+        {'date': date, 'previous_date': previous_date}
+    )
+    cursor.execute('DROP TABLE parsed_scvs')
 
-    #replace descendent MONDO IDs of same variants with ancestors shown in submissions of the same variant
-    all_scvs_and_fixed_mondos = []
-    variants = list(cursor.execute('SELECT DISTINCT variant_name FROM submissions'))
-    for variant_name in variants:
-        subs_for_variant = list(cursor.execute(
-            'SELECT scv, primary_mondo_xref FROM submissions WHERE variant_name=?',
-            [variant_name[0]]
-        ))
+    cursor.execute('''
+        INSERT OR REPLACE INTO clinvarset_digests
+        SELECT :date, d.digest, d.scv, d.primary_mondo_xref, u.ordinal
+        FROM clinvarset_digests d INNER JOIN unchanged_digests u ON u.digest=d.digest
+        WHERE d.date=:previous_date
+    ''', {'date': date, 'previous_date': previous_date})
+
+    db.commit()
+
+def reinsert_last_duplicate_scvs(db, date, filename):
+    #a parsed release saved by an incremental import has the unchanged ClinVarSets after the changed ones, so when an
+    #SCV is in more than one ClinVarSet, derive it again from the ClinVarSet that came last in the release
+    winners = set(db.execute('''
+        SELECT d.digest, d.scv FROM clinvarset_digests d INNER JOIN (
+            SELECT scv, MAX(ordinal) AS ordinal FROM clinvarset_digests WHERE date=:date
+            GROUP BY scv HAVING COUNT(*) > 1
+        ) w ON w.scv=d.scv AND w.ordinal=d.ordinal
+        WHERE d.date=:date
+    ''', {'date': date}))
+    winning_digests = set(map(itemgetter(0), winners))
+    submissions = []
+    with open_release(filename) as f:
+        for ordinal, digest, clinvarset in read_parsed_release(f)[1]:
+            if digest in winning_digests:
+                submissions += filter(
+                    lambda submission: (digest, submission[14]) in winners, derive_submissions(date, clinvarset)
+                )
+    db.executemany('INSERT OR REPLACE INTO submissions VALUES (' + ','.join('?' * 26) + ')', submissions)
+    db.commit()
+
+def get_primary_mondo_xref_fixes(rows):
+    #replace descendent MONDO IDs of same variants with ancestors shown in submissions of the same variant, given
+    #(variant_name, scv, primary_mondo_xref) rows sorted by variant name
+    for variant_name, subs_for_variant in groupby(rows, itemgetter(0)):
+        subs_for_variant = list(subs_for_variant)
         if len(subs_for_variant) <= 1:
             continue
-        scvs, condition_mondo_ids = zip(*subs_for_variant)
-        condition_mondo_ids = list(condition_mondo_ids)
-        scvs = list(scvs)
+        condition_mondo_ids = list(map(itemgetter(2), subs_for_variant))
         fixed_condition_mondo_ids = mondo.replace_descendent_mondo_xrefs(condition_mondo_ids)
-        scvs_and_fixed_mondos = list(zip(scvs, fixed_condition_mondo_ids))
-        for condition_mondo_id, pair in zip(condition_mondo_ids, scvs_and_fixed_mondos):
-            if pair[1] != condition_mondo_id:
-                all_scvs_and_fixed_mondos.append(pair)
-    #print(len(all_scvs_and_fixed_mondos))
-    cursor.executemany('UPDATE submissions SET primary_mondo_xref=? WHERE scv=?', all_scvs_and_fixed_mondos)
+        for sub, fixed_condition_mondo_id in zip(subs_for_variant, fixed_condition_mondo_ids):
+            if fixed_condition_mondo_id != sub[2]:
+                yield sub[1], fixed_condition_mondo_id
+
+def fix_primary_mondo_xrefs(db, date):
+    start_time = perf_counter()
+    cursor = db.cursor()
+
+    fixes = list(get_primary_mondo_xref_fixes(cursor.execute(
+        'SELECT variant_name, scv, primary_mondo_xref FROM submissions WHERE date=? ORDER BY variant_name, scv',
+        [date]
+    )))
+
+    cursor.execute('DROP TABLE IF EXISTS temp.mondo_fixes')
+    cursor.execute('CREATE TEMP TABLE mondo_fixes (scv INTEGER PRIMARY KEY, primary_mondo_xref TEXT)')
+    cursor.executemany('INSERT INTO mondo_fixes VALUES (?,?)', fixes)
+    cursor.execute('''
+        UPDATE submissions
+        SET primary_mondo_xref=(SELECT primary_mondo_xref FROM mondo_fixes WHERE scv=submissions.scv)
+        WHERE date=? AND scv IN (SELECT scv FROM mondo_fixes)
+    ''', [date])
+    cursor.execute('DROP TABLE mondo_fixes')
+
+    print(f'Replaced {len(fixes)} descendent Mondo xrefs in {perf_counter() - start_time:.1f} seconds')
+    return len(fixes)
+
+#the tables that hold the rows of each release
+release_tables = [
+    'submissions',
+    'comparisons',
+    'clinvarset_digests',
+    'changed_variants',
+    'mondo_clinvar_relationships',
+    'import_progress',
+]
+
+def delete_release(db, date):
+    for table in release_tables:
+        db.execute('DELETE FROM ' + table + ' WHERE date=?', [date])
+
+def get_import_progress(db, date):
+    return dict(db.execute('SELECT stage, previous_date FROM import_progress WHERE date=?', [date]))
+
+def finish_stage(db, date, stage, previous_date):
+    #commit the stage's changes along with the record that it finished
+    db.execute('INSERT OR REPLACE INTO import_progress VALUES (?,?,?)', [date, stage, previous_date])
+    db.commit()
+
+def save_unchanged_clinvarsets(writer, parsed_dir, previous_date, unchanged_digests):
+    #a parsed release has to be complete, so carry the ClinVarSets that were skipped over from the previous one
+    previous_filename = parsed_release_filename(parsed_dir, previous_date)
+    if not exists(previous_filename):
+        print('No parsed release for ' + previous_date + ', so not saving one for ' + writer.filename)
+        writer.discard()
+        return
+    unchanged_digests = dict(unchanged_digests)
+    with open_release(previous_filename) as f:
+        for previous_ordinal, digest, clinvarset in read_parsed_release(f)[1]:
+            if digest in unchanged_digests:
+                writer.write(unchanged_digests[digest], digest, clinvarset)
+    writer.close()
+
+def import_submissions(pool, db, budget, decoder, batch_size, filename, delta, bulk_load, parsed_dir):
+    cursor = db.cursor()
+
+    with open_release(filename) as f:
+        if f.peek(1)[:1] == b'\x80':
+            #a parsed release saved by an earlier import, which only needs the derived columns to be redone
+            date, clinvarsets = read_parsed_release(f)
+            get_results = partial(get_rederived_submissions, date, bool(parsed_dir))
+            get_size = get_parsed_clinvarset_size
+            delta = False
+        else:
+            date, clinvarsets = read_release(f)
+            clinvarsets = enumerate(clinvarsets)
+            get_results = partial(get_digested_submissions, date, bool(parsed_dir))
+            get_size = get_numbered_set_xml_size
+
+            progress = get_import_progress(db, date)
+            if 'submissions' in progress and len(progress) < len(import_stages):
+                finished_stages = list(filter(lambda stage: stage in progress, import_stages))
+                print('Resuming the import of ' + date + ' after its ' + ', '.join(finished_stages) + ' stages')
+                return date, progress['submissions'], None, None
+
+        #start over from nothing, whether the release was interrupted while inserting or was imported before
+        delete_release(db, date)
+
+        previous_date = None
+        if delta:
+            previous_date = list(cursor.execute(
+                'SELECT MAX(date) FROM clinvarset_digests WHERE date<?', [date]
+            ))[0][0]
+            if not previous_date:
+                print('No previous release to compare ' + date + ' to, importing it in full')
+            elif len(get_import_progress(db, previous_date)) < len(import_stages):
+                #the comparisons of unchanged variants are copied from the previous release too
+                print('The import of ' + previous_date + ' never finished, importing ' + date + ' in full')
+                previous_date = None
+            elif list(cursor.execute(
+                'SELECT ordinal FROM clinvarset_digests WHERE date=? LIMIT 1', [previous_date]
+            ))[0][0] == None:
+                print('The import of ' + previous_date + ' is too old to compare ' + date + ' to, importing it in full')
+                previous_date = None
+
+        if previous_date:
+            #only parse the ClinVarSets that were added or changed since the previous release, and the ones that lost
+            #an SCV to a later ClinVarSet, because their copy of the SCV wasn't kept
+            previous_digests = set(map(lambda row: row[0], cursor.execute(
+                'SELECT DISTINCT digest FROM clinvarset_digests WHERE date=?', [previous_date]
+            )))
+            previous_digests -= set(map(lambda row: row[0], cursor.execute('''
+                SELECT DISTINCT d.digest FROM clinvarset_digests d INNER JOIN (
+                    SELECT scv, MAX(ordinal) AS ordinal FROM clinvarset_digests WHERE date=:date
+                    GROUP BY scv HAVING COUNT(*) > 1
+                ) w ON w.scv=d.scv
+                WHERE d.date=:date AND d.ordinal<w.ordinal
+            ''', {'date': previous_date})))
+            unchanged_digests = []
+            clinvarsets = skip_unchanged(clinvarsets, previous_digests, unchanged_digests)
+
+        submission_sets = pool.imap(get_results, budget.throttle(clinvarsets, get_size), budget.chunk_size)
+
+        writer = ParsedReleaseWriter(parsed_dir, date) if parsed_dir else None
+        try:
+            #write in batches while the workers keep parsing, committing each batch so that the database lock is
+            #only held briefly at a time
+            submissions = []
+            digests = []
+            total_clinvarsets = 0
+            total_submissions = 0
+            last_ordinal = -1
+            in_order = True
+            for ordinal, digest, clinvarset, submission_set in submission_sets:
+                budget.release()
+                total_clinvarsets += 1
+                in_order = in_order and ordinal > last_ordinal
+                last_ordinal = ordinal
+                if writer:
+                    writer.write(ordinal, digest, clinvarset)
+                submission_set = decoder.decode(submission_set, submission_string_columns)
+                total_submissions += len(submission_set)
+                submissions += submission_set
+                digests += map(
+                    lambda submission: (date, digest, submission[14], submission[22], ordinal), submission_set
+                )
+                if len(submissions) >= batch_size:
+                    insert_submissions(db, submissions, digests, bulk_load)
+                    submissions = []
+                    digests = []
+            insert_submissions(db, submissions, digests, bulk_load)
+
+            if writer and previous_date:
+                save_unchanged_clinvarsets(writer, parsed_dir, previous_date, unchanged_digests)
+            elif writer:
+                writer.close()
+        except BaseException:
+            if writer:
+                writer.discard()
+            raise
+
+    if not in_order:
+        reinsert_last_duplicate_scvs(db, date, filename)
 
+    if previous_date:
+        del previous_digests
+        print(f'Copying {len(unchanged_digests)} unchanged ClinVarSets from {previous_date}')
+        copy_unchanged_submissions(db, date, previous_date, unchanged_digests)
+
+    #the numbers of ClinVarSets and submissions that were parsed, or None if the submissions had already been imported
+    return date, previous_date, total_clinvarsets, total_submissions
+
+def copy_unchanged_comparisons(db, date, previous_date):
+    #comparisons between the submissions of unchanged variants are unchanged too
+    cursor = db.cursor()
+    columns = table_columns(cursor, 'comparisons')
     cursor.execute('''
         INSERT OR REPLACE INTO comparisons
-        SELECT
-            t1.*,
-            t2.submitter_id,
-            t2.submitter_name,
-            t2.scv,
-            t2.significance,
-            t2.normalized_significance,
-            t2.star_level,
-            t2.condition_name,
-            t2.primary_mondo_xref,
-            t2.normalized_method,
-            CASE
-                WHEN t1.scv=t2.scv THEN -1
-
-                WHEN t1.significance=t2.significance THEN 0
-                WHEN t1.normalized_significance="not provided" OR t2.normalized_significance="not provided" THEN 0
-
-                WHEN t1.normalized_significance=t2.normalized_significance THEN 1
-
-                WHEN t1.normalized_significance="benign" AND t2.normalized_significance="likely benign" THEN 2
-                WHEN t1.normalized_significance="likely benign" AND t2.normalized_significance="benign" THEN 2
-                WHEN t1.normalized_significance="pathogenic" AND t2.normalized_significance="likely pathogenic" THEN 2
-                WHEN t1.normalized_significance="likely pathogenic" AND t2.normalized_significance="pathogenic" THEN 2
-
-                WHEN t1.normalized_significance IN ("benign", "likely benign") AND t2.normalized_significance="uncertain significance" THEN 3
-                WHEN t1.normalized_significance="uncertain significance" AND t2.normalized_significance IN ("benign", "likely benign") THEN 3
-
-                WHEN t1.normalized_significance IN ("benign", "likely benign", "uncertain significance") AND t2.normalized_significance IN ("pathogenic", "likely pathogenic") THEN 5
-                WHEN t1.normalized_significance IN ("pathogenic", "likely pathogenic") AND t2.normalized_significance IN ("benign", "likely benign", "uncertain significance") THEN 5
-
-                ELSE 4
-            END AS conflict_level,
-            -1
-        FROM submissions t1 INNER JOIN submissions t2
-        ON t1.date=? AND t2.date=? AND t1.variant_name=t2.variant_name
-        ORDER BY conflict_level, variant_name
-    ''', [date, date])
+        SELECT ''' + ', '.join(map(lambda column: ':date' if column == 'date' else column, columns)) + '''
+        FROM comparisons
+        WHERE date=:previous_date AND variant_name NOT IN (
+            SELECT variant_name FROM changed_variants WHERE date=:date
+        )
+    ''', {'date': date, 'previous_date': previous_date})
+    db.commit()
+
+def get_conflict_level(submission1, submission2):
+    if submission1[14] == submission2[14]:
+        return -1
+
+    significance1, normalized_significance1 = submission1[15:17]
+    significance2, normalized_significance2 = submission2[15:17]
+
+    if significance1 == significance2:
+        return 0
+    if normalized_significance1 == 'not provided' or normalized_significance2 == 'not provided':
+        return 0
+
+    if normalized_significance1 == normalized_significance2:
+        return 1
+
+    if {normalized_significance1, normalized_significance2} in [
+        {'benign', 'likely benign'},
+        {'pathogenic', 'likely pathogenic'},
+    ]:
+        return 2
+
+    if normalized_significance1 in benign_significances and normalized_significance2 == 'uncertain significance':
+        return 3
+    if normalized_significance1 == 'uncertain significance' and normalized_significance2 in benign_significances:
+        return 3
+
+    if normalized_significance1 in benign_or_uncertain_significances and normalized_significance2 in pathogenic_significances:
+        return 5
+    if normalized_significance1 in pathogenic_significances and normalized_significance2 in benign_or_uncertain_significances:
+        return 5
 
+    return 4
+
+#submitter_id, submitter_name, scv, significance, normalized_significance, star_level, condition_name,
+#primary_mondo_xref and normalized_method
+get_submission2_columns = itemgetter(9, 10, 14, 15, 16, 19, 20, 22, 24)
+
+def get_comparisons(submissions):
+    #compare every submission of a variant to every submission of the same variant, including itself, grouping the
+    #comparisons by conflict level
+    comparisons = [[] for conflict_level in range(-1, 6)]
+    submission2_columns = list(map(get_submission2_columns, submissions))
+    for submission1 in submissions:
+        for submission2, columns2 in zip(submissions, submission2_columns):
+            conflict_level = get_conflict_level(submission1, submission2)
+            comparisons[conflict_level + 1].append(submission1 + columns2 + (conflict_level, -1))
+    return comparisons
+
+def get_encoded_comparisons(submissions):
+    return list(map(
+        lambda comparisons: string_encoder.encode(comparisons, comparison_string_columns), get_comparisons(submissions)
+    ))
+
+def get_comparisons_size(submissions):
+    #each comparison takes roughly half a kilobyte
+    return len(submissions) ** 2 * 512
+
+def read_variants(date, changed_variants_only):
+    #this runs in the worker pool's task thread, so it needs a database connection of its own
+    db = connect()
+    query = 'SELECT * FROM submissions WHERE date=:date'
+    if changed_variants_only:
+        query += ' AND variant_name IN (SELECT variant_name FROM changed_variants WHERE date=:date)'
+    query += ' ORDER BY variant_name, scv'
+    for variant_name, submissions in groupby(db.execute(query, {'date': date}), itemgetter(2)):
+        yield list(submissions)
+    db.close()
+
+def compare_submissions(pool, db, budget, decoder, batch_size, date, changed_variants_only):
+    start_time = perf_counter()
+    cursor = db.cursor()
+
+    #spool the comparisons into a temporary table for each conflict level so that they can be inserted in order of
+    #conflict level and variant without sorting them
+    spools = list(map(lambda conflict_level: 'comparisons_spool' + str(conflict_level + 1), range(-1, 6)))
+    for spool in spools:
+        cursor.execute('DROP TABLE IF EXISTS temp.' + spool)
+        cursor.execute('CREATE TEMP TABLE ' + spool + ' AS SELECT * FROM comparisons WHERE 0')
+
+    comparison_sets = pool.imap(
+        get_encoded_comparisons,
+        budget.throttle(read_variants(date, changed_variants_only), get_comparisons_size),
+        budget.chunk_size
+    )
+
+    total_variants = 0
+    total_comparisons = 0
+    spooled_comparisons = list(map(lambda spool: [], spools))
+    for comparison_set in comparison_sets:
+        budget.release()
+        total_variants += 1
+        for spool_comparisons, comparisons in zip(spooled_comparisons, comparison_set):
+            comparisons = decoder.decode(comparisons, comparison_string_columns)
+            total_comparisons += len(comparisons)
+            spool_comparisons += comparisons
+        if sum(map(len, spooled_comparisons)) >= batch_size:
+            spool_all_comparisons(cursor, spools, spooled_comparisons)
+            spooled_comparisons = list(map(lambda spool: [], spools))
+    spool_all_comparisons(cursor, spools, spooled_comparisons)
+
+    for spool in spools:
+        cursor.execute('INSERT OR REPLACE INTO comparisons SELECT * FROM ' + spool + ' ORDER BY rowid')
+        cursor.execute('DROP TABLE ' + spool)
+    db.commit()
+
+    print(f'Compared the submissions of {total_variants} variants in {perf_counter() - start_time:.1f} seconds')
+    return total_variants, total_comparisons
+
+def spool_all_comparisons(cursor, spools, spooled_comparisons):
+    for spool, comparisons in zip(spools, spooled_comparisons):
+        cursor.executemany('INSERT INTO ' + spool + ' VALUES (' + ','.join('?' * 37) + ')', comparisons)
+
+def create_import_indexes(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__date ON submissions (date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__variant_name ON submissions (variant_name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__scv ON submissions (scv)')
     cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__date ON comparisons (date)')
     cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__primary_mondo_xref1 ON comparisons (primary_mondo_xref1)')
     cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__primary_mondo_xref2 ON comparisons (primary_mondo_xref2)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS mondo_clinvar_relationships__date ON mondo_clinvar_relationships (date)')
 
-    cursor.execute('''
-        UPDATE comparisons
-        SET normalized_conflict_level=conflict_level
-        WHERE date=? AND primary_mondo_xref1=primary_mondo_xref2
-    ''', [date])
+def start_bulk_load():
+    #inserting is much faster without any secondary indexes to keep up to date, so drop them all and remember how to
+    #recreate them
+    db = connect()
+    indexes = list(db.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL"))
+    #an interrupted bulk load may already have dropped some, so they're remembered in the database until recreated
+    db.executemany('INSERT OR IGNORE INTO dropped_indexes VALUES (?)', map(lambda index: [index[1]], indexes))
+    for name, sql in indexes:
+        db.execute('DROP INDEX ' + name)
+    db.commit()
+    index_definitions = list(map(itemgetter(0), db.execute('SELECT sql FROM dropped_indexes')))
+    db.close()
+    return index_definitions
+
+def finish_bulk_load(index_definitions):
+    db = connect(bulk_load=True)
+    cursor = db.cursor()
+
+    print('Recreating indexes')
+    for sql in index_definitions:
+        cursor.execute(sql)
+    create_import_indexes(cursor)
+    cursor.execute('DELETE FROM dropped_indexes')
+    cursor.execute('ANALYZE')
+    db.commit()
+
+    print('Checking database integrity')
+    problems = list(map(itemgetter(0), cursor.execute('PRAGMA integrity_check')))
+    db.close()
+    if problems != ['ok']:
+        raise RuntimeError(database + ' failed the integrity check:\n' + '\n'.join(problems))
+
+    #synchronous writes were turned off, so make sure that everything has really been written to disk
+    with open(database, 'rb') as f:
+        fsync(f.fileno())
+
+def get_mondo_relationships(date, clinvar_name, condition_xrefs):
+    for xref in condition_xrefs.split(';'):
+        if xref.startswith('MONDO:'):
+            mondo_name = mondo.mondo_xref_to_name[xref]
+            mondo_id = xref[len('MONDO:'):]
+            yield date, mondo_id, mondo_name, clinvar_name
 
-    for row in list(cursor.execute('SELECT DISTINCT condition_name, condition_xrefs FROM submissions WHERE date=?', [date])):
-        clinvar_name = row[0]
-        xrefs = row[1].split(';')
-        for xref in xrefs:
-            if xref.startswith('MONDO:'):
-                mondo_name = mondo.mondo_xref_to_name[xref]
-                mondo_id = xref[len('MONDO:'):]
-                cursor.execute(
-                    'INSERT OR REPLACE INTO mondo_clinvar_relationships VALUES (?,?,?,?)',
-                    [date, mondo_id, mondo_name, clinvar_name]
+            #associate ClinVar condition names with all of their Mondo ancestors too
+            for ancestor_xref in mondo.ancestors(xref):
+                if ancestor_xref not in mondo.mondo_xref_to_name:
+                    continue #this is a deprecated term
+                ancestor_id = ancestor_xref[len('MONDO:'):]
+                ancestor_name = mondo.mondo_xref_to_name[ancestor_xref]
+                yield date, ancestor_id, ancestor_name, clinvar_name
+
+def freeze_lookup_tables():
+    #Mondo and the other lookup tables are never changed, so take them out of the garbage collector's hands before
+    #forking the workers; otherwise every collection in a worker would write to, and so copy, the memory that they're
+    #in. gc.freeze is new in Python 3.7.
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+def get_default_rss_budget():
+    #in megabytes, like the other budgets
+    return virtual_memory().available * 3 // 4 // (1024 * 1024)
+
+def import_file(filename, memory_budget=default_memory_budget, batch_size=default_batch_size, processes=None,
+                delta=False, bulk_load=False, parsed_dir=None, rss_budget=None):
+    rss_budget = (rss_budget or get_default_rss_budget()) * 1024 * 1024
+    #the pages that the writer caches while bulk loading come out of the same budget as the workers
+    cache_size = get_bulk_load_cache_size(rss_budget) if bulk_load else 0
+    processes, planned_chunk_size = plan_workers(rss_budget - cache_size, processes or cpu_count())
+
+    freeze_lookup_tables()
+    with Pool(processes) as pool:
+        #open files and connect after forking so that the workers don't inherit them
+        db = connect(bulk_load, rss_budget)
+        cursor = db.cursor()
+        budget = MemoryBudget(memory_budget * 1024 * 1024, processes, planned_chunk_size)
+        decoder = StringDecoder()
+        profiler = Profiler('import-clinvar-xml.py', db)
+
+        with MemoryMonitor(budget, rss_budget):
+            #skips straight to the first unfinished stage if an earlier import of the same release was interrupted
+            with profiler.stage('submissions') as stage:
+                date, previous_date, stage.rows_in, stage.rows_out = import_submissions(
+                    pool, db, budget, decoder, batch_size, filename, delta, bulk_load, parsed_dir
                 )
+                stage.date = date
+                stage.skipped = stage.rows_in == None #resumed after the submissions
+                finish_stage(db, date, 'submissions', previous_date)
+            progress = get_import_progress(db, date)
 
-    cursor.execute('CREATE INDEX IF NOT EXISTS mondo_clinvar_relationships__date ON mondo_clinvar_relationships (date)')
+            if 'mondo_fixes' not in progress:
+                with profiler.stage('mondo_fixes', date) as stage:
+                    stage.rows_out = fix_primary_mondo_xrefs(db, date)
+                    finish_stage(db, date, 'mondo_fixes', previous_date)
 
-    #add rows to associate ClinVar condition names with all of their Mondo ancestors
-    for row in list(cursor.execute('SELECT mondo_id, clinvar_name FROM mondo_clinvar_relationships WHERE date=?', [date])):
-        mondo_id = row[0]
-        clinvar_name = row[1]
-        for ancestor_xref in mondo.ancestors('MONDO:' + str(mondo_id).zfill(7)):
-            if ancestor_xref not in mondo.mondo_xref_to_name:
-                continue #this is a deprecated term
-            ancestor_id = ancestor_xref[len('MONDO:'):]
-            ancestor_name = mondo.mondo_xref_to_name[ancestor_xref]
-            cursor.execute(
+            if 'comparisons' not in progress:
+                with profiler.stage('comparisons', date) as stage:
+                    #comparisons are committed as they are made, so clear out any that an interrupted import left
+                    #behind
+                    cursor.execute('DELETE FROM comparisons WHERE date=?', [date])
+                    if previous_date:
+                        copy_unchanged_comparisons(db, date, previous_date)
+                    stage.rows_in, stage.rows_out = compare_submissions(
+                        pool, db, budget, decoder, batch_size, date, bool(previous_date)
+                    )
+                    finish_stage(db, date, 'comparisons', previous_date)
+
+    if 'normalized_conflict_levels' not in progress:
+        with profiler.stage('normalized_conflict_levels', date) as stage:
+            cursor.execute('''
+                UPDATE comparisons
+                SET normalized_conflict_level=conflict_level
+                WHERE date=? AND primary_mondo_xref1=primary_mondo_xref2
+            ''', [date])
+            stage.rows_out = cursor.rowcount
+            finish_stage(db, date, 'normalized_conflict_levels', previous_date)
+
+    with profiler.stage('relationships', date) as stage:
+        cursor.execute('DELETE FROM mondo_clinvar_relationships WHERE date=?', [date])
+        conditions = list(cursor.execute(
+            'SELECT DISTINCT condition_name, condition_xrefs FROM submissions WHERE date=?', [date]
+        ))
+        stage.rows_in = len(conditions)
+        for row in conditions:
+            cursor.executemany(
                 'INSERT OR REPLACE INTO mondo_clinvar_relationships VALUES (?,?,?,?)',
-                [date, ancestor_id, ancestor_name, clinvar_name]
+                get_mondo_relationships(date, row[0], row[1])
             )
+        #rowcount would also count the rows that were replaced
+        stage.rows_out = list(cursor.execute(
+            'SELECT COUNT(*) FROM mondo_clinvar_relationships WHERE date=?', [date]
+        ))[0][0]
+
+        cursor.execute('DELETE FROM changed_variants WHERE date=?', [date])
+        cursor.execute('INSERT OR REPLACE INTO import_progress VALUES (?,?,?)', [date, 'relationships', previous_date])
+
+    #every stage looks rows up by primary key, so the indexes aren't needed until the import is done
+    if not bulk_load:
+        with profiler.stage('import_indexes', date):
+            create_import_indexes(cursor)
 
     db.commit()
+    profiler.report()
+    profiler.save(db)
     db.close()
 
+def import_file_part(filename, part, memory_budget, batch_size, processes, parsed_dir, rss_budget):
+    #runs in a child process that writes the release to a database of its own
+    global database
+    database = part
+    create_tables()
+    import_file(
+        filename, memory_budget, batch_size, processes, bulk_load=True, parsed_dir=parsed_dir, rss_budget=rss_budget
+    )
+
+def merge_file_part(part, bulk_load, rss_budget=None):
+    db = connect(bulk_load, rss_budget)
+    db.execute('ATTACH DATABASE ? AS part', [part])
+    for date in list(map(itemgetter(0), db.execute('SELECT DISTINCT date FROM part.submissions'))):
+        delete_release(db, date) #the part holds the whole release, so replace any earlier import of it
+    for table in release_tables:
+        db.execute('INSERT OR REPLACE INTO ' + table + ' SELECT * FROM part.' + table)
+    create_profile_table(db)
+    db.execute('INSERT INTO stage_profiles SELECT * FROM part.stage_profiles')
+    db.commit()
+    db.execute('DETACH DATABASE part')
+    db.close()
+    remove_file_part(part)
+
+def import_files_in_parallel(filenames, jobs, memory_budget, batch_size, processes, bulk_load, parsed_dir,
+                             rss_budget, on_merged=None):
+    #parse several releases at once into separate databases, merging each one into the main database as soon as it's
+    #done; the children are forked, so Mondo and the other lookup tables are only loaded once
+    processes = max((processes or cpu_count()) // jobs, 1)
+    rss_budget = (rss_budget or get_default_rss_budget()) // jobs
+    #filenames can be a generator that is still downloading the releases, so it's only read when a job is free
+    queue = enumerate(filenames)
+    freeze_lookup_tables()
+    queued = True
+    running = {}
+    try:
+        while queued or running:
+            while queued and len(running) < jobs:
+                next_file = next(queue, None)
+                if next_file == None:
+                    queued = False
+                    break
+                i, filename = next_file
+                part = database + '.part' + str(i)
+                remove_file_part(part)
+                child = Process(
+                    target=import_file_part,
+                    args=(filename, part, memory_budget // jobs, batch_size, processes, parsed_dir, rss_budget),
+                )
+                child.start()
+                running[child.sentinel] = (child, filename, part)
+            if not running:
+                break
+            for sentinel in wait(list(running)):
+                child, filename, part = running.pop(sentinel)
+                child.join()
+                if child.exitcode:
+                    remove_file_part(part)
+                    raise RuntimeError('Failed to import ' + filename)
+                print('Merging ' + filename)
+                merge_file_part(part, bulk_load, rss_budget * 1024 * 1024)
+                if on_merged:
+                    on_merged(filename)
+    finally:
+        for child, filename, part in running.values():
+            child.terminate()
+            child.join()
+            remove_file_part(part)
+
+    if not bulk_load:
+        #the parts were bulk loaded, so they didn't create the indexes that a release imported on its own has
+        db = connect()
+        create_import_indexes(db.cursor())
+        db.commit()
+        db.close()
+
+def remove_file_part(part):
+    for filename in [part, part + '-journal']:
+        if exists(filename):
+            remove(filename)
+
+def time_extractor(name, extract, set_xmls):
+    start_time = perf_counter()
+    clinvarsets = list(map(extract, set_xmls))
+    seconds = perf_counter() - start_time
+    print(f'{name:>16}: {seconds:6.2f} seconds, {seconds * 1000000 / len(set_xmls):5.0f} microseconds per ClinVarSet')
+    return clinvarsets
+
+def benchmark(filenames, count):
+    #time every parser backend and extractor on the same ClinVarSets in this process, without touching the database
+    global xml_backend
+    for filename in filenames:
+        with open_release(filename) as f:
+            date, clinvarsets = read_release(f)
+            set_xmls = list(islice(clinvarsets, count))
+        if not set_xmls:
+            continue
+        print(f'First {len(set_xmls)} ClinVarSets of {filename} ({date}):')
+
+        results = {}
+        for backend in xmlbackend.backends.values():
+            xml_backend = backend
+            results[f'tree ({backend.name})'] = time_extractor(f'tree ({backend.name})', extract_clinvarset, set_xmls)
+        results['events (expat)'] = time_extractor('events (expat)', extract_clinvarset_events, set_xmls)
+
+        expected_name, expected = next(iter(results.items()))
+        for name, clinvarsets in results.items():
+            if clinvarsets != expected:
+                print(f'Warning: {name} did not extract the same fields as {expected_name}')
+
+        time_extractor('derive', lambda clinvarset: derive_submissions(date, clinvarset), expected)
+
 if __name__ == '__main__':
-    if len(argv) < 2:
-        print('Usage: ./import-clinvar-xml.py ClinVarFullRelease_<year>-<month>.xml ...')
+    parser = ArgumentParser(
+        description='Import ClinVar full release XML files into clinvar.db (or the database named by $CLINVAR_DB)'
+    )
+    parser.add_argument(
+        'filenames', nargs='+', metavar='ClinVarFullRelease_<year>-<month>.xml[.gz]',
+        help='uncompressed or gzipped release, or - to read from standard input; a parsed release saved by '
+             '--save-parsed can be given instead to rederive that release without parsing its XML again'
+    )
+    parser.add_argument(
+        '--memory-budget', type=int, default=default_memory_budget, metavar='MB',
+        help='megabytes of XML that may be waiting to be parsed or written at once'
+    )
+    parser.add_argument(
+        '--batch-size', type=int, default=default_batch_size, metavar='N',
+        help='number of submissions to insert per transaction'
+    )
+    parser.add_argument(
+        '--processes', type=int, metavar='N',
+        help='most parser processes to start, if the RSS budget allows that many (default: one per CPU)'
+    )
+    parser.add_argument(
+        '--rss-budget', type=int, metavar='MB',
+        help='megabytes of memory that the import and its parser processes may use, which decides how many parser '
+             'processes to start and how many of them to keep busy; a quarter of it, up to 2 GB, goes to SQLite\'s '
+             'page cache when bulk loading (default: three quarters of the available memory)'
+    )
+    parser.add_argument(
+        '--delta', action='store_true',
+        help='only parse ClinVarSets that changed since the previous release and copy the rest forward'
+    )
+    parser.add_argument(
+        '--jobs', type=int, default=1, metavar='N',
+        help='number of releases to import at the same time, each with its share of the parser processes'
+    )
+    parser.add_argument(
+        '--bulk-load', action='store_true',
+        help='drop indexes and relax durability while importing, then rebuild the indexes, analyze and check the '
+             'database (only use on a database that the web server is not using)'
+    )
+    parser.add_argument(
+        '--save-parsed', metavar='DIR', dest='parsed_dir',
+        help='also save the fields parsed from each release to DIR/ClinVarParsedRelease_<date>.pickle.gz'
+    )
+    parser.add_argument(
+        '--extractor', choices=['tree', 'events'], default=extractor,
+        help='parse each ClinVarSet into a tree and search it, or pick the fields out of the parser events in a single '
+             'pass, which is faster (default: tree)'
+    )
+    parser.add_argument(
+        '--xml-backend', choices=list(xmlbackend.backends), default=xml_backend.name,
+        help=f'parse each ClinVarSet with lxml or ElementTree when using the tree extractor '
+             f'(default: {xml_backend.name})'
+    )
+    parser.add_argument(
+        '--benchmark', type=int, metavar='N',
+        help='instead of importing, time each XML backend and extractor on the first N ClinVarSets of each release'
+    )
+    args = parser.parse_args()
+    if args.jobs > 1 and args.delta:
+        parser.error('--delta imports one release at a time')
+    if args.jobs > 1 and '-' in args.filenames:
+        parser.error('standard input cannot be read when importing releases in parallel')
+
+    extractor = args.extractor
+    xml_backend = xmlbackend.backends[args.xml_backend]
+
+    if args.benchmark:
+        benchmark(args.filenames, args.benchmark)
         exit()
 
     create_tables()
-    for filename in argv[1:]:
-        import_file(filename)
+    if args.bulk_load:
+        index_definitions = start_bulk_load()
+    if args.jobs > 1:
+        import_files_in_parallel(
+            args.filenames, args.jobs, args.memory_budget, args.batch_size, args.processes, args.bulk_load,
+            args.parsed_dir, args.rss_budget
+        )
+    else:
+        for filename in args.filenames:
+            import_file(
+                filename, args.memory_budget, args.batch_size, args.processes, args.delta, args.bulk_load,
+                args.parsed_dir, args.rss_budget
+            )
+    if args.bulk_load:
+        finish_bulk_load(index_definitions)
@@ -1,8 +1,7 @@
 #!/bin/bash
 
-filename=ClinVarFullRelease_00-latest.xml
-url=https://ftp.ncbi.nlm.nih.gov/pub/clinvar/xml/RCV_xml_old_format/$filename.gz
+filename=ClinVarFullRelease_00-latest.xml.gz
+url=https://ftp.ncbi.nlm.nih.gov/pub/clinvar/xml/RCV_xml_old_format/$filename
 
 echo Downloading $url
-curl $url | gunzip > $filename 2> /dev/null
-./import-clinvar-xml.py $filename
+curl $url | ./import-clinvar-xml.py --delta --bulk-load --extractor events --save-parsed parsed-releases -
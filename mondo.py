@@ -1,19 +1,101 @@
 #!/usr/bin/python3
 
-from xml.etree import ElementTree
+from array import array
+from bisect import bisect_left
+from itertools import chain
+from os import getpid, remove, rename, stat
+from os.path import exists
+from xmlbackend import default_backend
+import pickle
+
+#change this whenever what's kept in the cache changes so that old caches are rebuilt
+cache_format = 2
+cached_attributes = [
+    'xref_to_mondo_xref',
+    'name_to_mondo_xref',
+    'mondo_xref_to_name',
+    'mondo_xrefs',
+    'mondo_ids',
+    'parent_offsets',
+    'parent_ids',
+    'ancestor_offsets',
+    'ancestor_ids',
+    'ancestor_distances',
+]
 
 def iri_to_mondo_xref(iri):
     if not iri or not iri.startswith('http://purl.obolibrary.org/obo/MONDO_'):
         return None
     return 'MONDO:' + iri[len('http://purl.obolibrary.org/obo/MONDO_'):]
 
+def iterparse_classes(path_to_mondo_owl, xml_backend):
+    #yield the owl:Class elements directly under the root one at a time and throw each one away once it's been used,
+    #because the whole document takes many times as much memory as what's taken from it
+    depth = 0
+    for event, el in xml_backend.iterparse(path_to_mondo_owl, ['start', 'end']):
+        if event == 'start':
+            if depth == 0:
+                root = el
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        if el.tag == '{http://www.w3.org/2002/07/owl#}Class':
+            yield el
+        el.clear()
+        root.remove(el)
+
+def changed_keys(old_dict, new_dict):
+    return set(filter(lambda key: old_dict.get(key) != new_dict.get(key), old_dict.keys() | new_dict.keys()))
+
 class Mondo:
-    xref_to_mondo_xref = {}
-    name_to_mondo_xref = {}
-    mondo_xref_to_name = {}
-    parents_by_mondo_xref = {}
+    def __init__(self, path_to_mondo_owl = 'mondo.owl', xml_backend = default_backend, use_cache = True):
+        #parsing mondo.owl takes much longer than loading what was parsed from it the last time, so keep that in
+        #mondo.owl.pickle and parse mondo.owl again only if its modification time or size changes
+        cache_path = path_to_mondo_owl + '.pickle'
+        owl_stat = stat(path_to_mondo_owl)
+        cache_key = [cache_format, owl_stat.st_mtime_ns, owl_stat.st_size]
+        if use_cache and self.load_cache(cache_path, cache_key):
+            return
+        self.index_ancestors(self.parse(path_to_mondo_owl, xml_backend))
+        if use_cache:
+            self.save_cache(cache_path, cache_key)
+
+    def load_cache(self, cache_path, cache_key):
+        try:
+            with open(cache_path, 'rb') as f:
+                if pickle.load(f) != cache_key:
+                    return False
+                self.__dict__.update(pickle.load(f))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False
+        return True
+
+    def save_cache(self, cache_path, cache_key):
+        #several importer processes can load Mondo at the same time, so each writes its own file and renames it over
+        #the cache once it's complete
+        temp_path = cache_path + '.' + str(getpid()) + '.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                pickle.dump(cache_key, f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(
+                    dict(map(lambda name: (name, getattr(self, name)), cached_attributes)), f, pickle.HIGHEST_PROTOCOL
+                )
+            rename(temp_path, cache_path)
+        except OSError:
+            #the cache only saves time, so carry on without it if it can't be written
+            if exists(temp_path):
+                remove(temp_path)
+
+    def parse(self, path_to_mondo_owl, xml_backend):
+        #each instance has its own dictionaries so that two versions of Mondo can be compared. They only hold strings,
+        #so the garbage collector never has to look through them.
+        self.xref_to_mondo_xref = {}
+        self.name_to_mondo_xref = {}
+        self.mondo_xref_to_name = {}
+        parents_by_mondo_xref = {}
 
-    def __init__(self, path_to_mondo_owl = 'mondo.owl'):
         ns = {
             'oboInOwl': 'http://www.geneontology.org/formats/oboInOwl#',
             'owl': 'http://www.w3.org/2002/07/owl#',
@@ -21,15 +103,14 @@ class Mondo:
             'rdfs': 'http://www.w3.org/2000/01/rdf-schema#',
         }
 
-        root = ElementTree.parse(path_to_mondo_owl)
-        for class_el in root.findall('./owl:Class', ns):
+        for class_el in iterparse_classes(path_to_mondo_owl, xml_backend):
             if '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about' not in class_el.attrib:
                 continue
             mondo_xref = iri_to_mondo_xref(class_el.attrib['{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about'])
             if not mondo_xref:
                 continue
 
-            label_el = class_el.find('./rdfs:label', ns)
+            label_el = xml_backend.find(class_el, './rdfs:label', ns)
             if label_el == None:
                 continue
             condition_name = label_el.text
@@ -37,34 +118,141 @@ class Mondo:
             self.name_to_mondo_xref[condition_name.lower()] = mondo_xref
             self.mondo_xref_to_name[mondo_xref] = condition_name
 
-            for xref_el in class_el.findall('./oboInOwl:hasDbXref', ns):
+            for xref_el in xml_backend.findall(class_el, './oboInOwl:hasDbXref', ns):
                 if not xref_el.text:
                     continue
                 self.xref_to_mondo_xref[xref_el.text.upper()] = mondo_xref
 
-            for synonym_el in class_el.findall('./oboInOwl:hasExactSynonym', ns):
+            for synonym_el in xml_backend.findall(class_el, './oboInOwl:hasExactSynonym', ns):
                 if synonym_el.text:
                     self.name_to_mondo_xref[synonym_el.text.lower()] = mondo_xref
 
-            for subclassof_el in class_el.findall('./rdfs:subClassOf', ns):
+            for subclassof_el in xml_backend.findall(class_el, './rdfs:subClassOf', ns):
                 if '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}resource' in subclassof_el.attrib:
                     parent_xref = iri_to_mondo_xref(
                         subclassof_el.attrib['{http://www.w3.org/1999/02/22-rdf-syntax-ns#}resource']
                     )
                     if not parent_xref:
                         continue
-                    if not mondo_xref in self.parents_by_mondo_xref:
-                        self.parents_by_mondo_xref[mondo_xref] = []
-                    self.parents_by_mondo_xref[mondo_xref].append(parent_xref)
+                    if not mondo_xref in parents_by_mondo_xref:
+                        parents_by_mondo_xref[mondo_xref] = []
+                    parents_by_mondo_xref[mondo_xref].append(parent_xref)
+
+        return parents_by_mondo_xref
+
+    def index_ancestors(self, parents_by_mondo_xref):
+        #number the terms and list the numbers of each term's ancestors in order in one array, so that checking whether
+        #a term is a descendent of another is a binary search instead of a walk up every path to the root, and keep how
+        #many generations up the closest path to each ancestor goes alongside them. Parents are kept the same way,
+        #because a few arrays that are never written to can be shared by the importer's forked workers where a list
+        #for every term would end up copied into each of them.
+        self.mondo_xrefs = sorted(
+            parents_by_mondo_xref.keys() | set(chain.from_iterable(parents_by_mondo_xref.values()))
+        )
+        self.mondo_ids = dict(map(reversed, enumerate(self.mondo_xrefs)))
+        parent_ids = [()] * len(self.mondo_xrefs)
+        for mondo_xref, parents in parents_by_mondo_xref.items():
+            parent_ids[self.mondo_ids[mondo_xref]] = tuple(map(self.mondo_ids.get, parents))
+        self.parent_offsets = array('i', [0])
+        self.parent_ids = array('i')
+        for parents in parent_ids:
+            self.parent_ids.extend(parents)
+            self.parent_offsets.append(len(self.parent_ids))
+
+        #a term's ancestors are its parents and its parents' ancestors, so start from the terms without parents and
+        #only go on to a term once all of its parents are done
+        children_ids = [[] for mondo_id in parent_ids]
+        unfinished_parents = list(map(len, parent_ids))
+        for mondo_id, parents in enumerate(parent_ids):
+            for parent_id in parents:
+                children_ids[parent_id].append(mondo_id)
+        ancestor_distances = [None] * len(parent_ids)
+        q = list(filter(lambda mondo_id: not parent_ids[mondo_id], range(len(parent_ids))))
+        while q:
+            mondo_id = q.pop()
+            distances = dict.fromkeys(parent_ids[mondo_id], 1)
+            for parent_id in parent_ids[mondo_id]:
+                for ancestor_id, distance in ancestor_distances[parent_id].items():
+                    if distances.get(ancestor_id, distance + 2) > distance + 1:
+                        distances[ancestor_id] = distance + 1
+            ancestor_distances[mondo_id] = distances
+            for child_id in children_ids[mondo_id]:
+                unfinished_parents[child_id] -= 1
+                if unfinished_parents[child_id] == 0:
+                    q.append(child_id)
+
+        #Mondo shouldn't have cycles, but if it does, the terms in them are their own ancestors
+        for mondo_id, distances in enumerate(ancestor_distances):
+            if distances != None:
+                continue
+            distances = {}
+            q = list(parent_ids[mondo_id])
+            distance = 1
+            while q:
+                q = list(filter(lambda ancestor_id: ancestor_id not in distances, q))
+                distances.update(dict.fromkeys(q, distance))
+                q = list(chain.from_iterable(map(parent_ids.__getitem__, q)))
+                distance += 1
+            ancestor_distances[mondo_id] = distances
+
+        self.ancestor_offsets = array('i', [0])
+        self.ancestor_ids = array('i')
+        self.ancestor_distances = array('i')
+        for distances in ancestor_distances:
+            for ancestor_id in sorted(distances):
+                self.ancestor_ids.append(ancestor_id)
+                self.ancestor_distances.append(distances[ancestor_id])
+            self.ancestor_offsets.append(len(self.ancestor_ids))
+
+    def parents(self, xref):
+        mondo_id = self.mondo_ids.get(xref)
+        if mondo_id == None:
+            return []
+        parent_ids = self.parent_ids[self.parent_offsets[mondo_id]:self.parent_offsets[mondo_id + 1]]
+        return list(map(self.mondo_xrefs.__getitem__, parent_ids))
 
-            del class_el #conserve memory
+    def has_parents(self, xref):
+        mondo_id = self.mondo_ids.get(xref)
+        return mondo_id != None and self.parent_offsets[mondo_id] != self.parent_offsets[mondo_id + 1]
+
+    def get_parents_by_mondo_xref(self):
+        return dict(map(
+            lambda mondo_xref: (mondo_xref, self.parents(mondo_xref)), filter(self.has_parents, self.mondo_xrefs)
+        ))
+
+    def changes_since(self, old):
+        #find everything that could make this version give a different answer than the old version did
+        changed_xrefs = changed_keys(old.xref_to_mondo_xref, self.xref_to_mondo_xref)
+        changed_names = changed_keys(old.name_to_mondo_xref, self.name_to_mondo_xref)
+        renamed_mondo_xrefs = changed_keys(old.mondo_xref_to_name, self.mondo_xref_to_name)
+
+        #a term's ancestors change if its parents change or if any of its ancestors' parents change
+        old_parents_by_mondo_xref = old.get_parents_by_mondo_xref()
+        parents_by_mondo_xref = self.get_parents_by_mondo_xref()
+        reparented_mondo_xrefs = changed_keys(old_parents_by_mondo_xref, parents_by_mondo_xref)
+        changed_mondo_xrefs = set(reparented_mondo_xrefs)
+        for version_parents_by_mondo_xref in [old_parents_by_mondo_xref, parents_by_mondo_xref]:
+            children_by_mondo_xref = {}
+            for mondo_xref, parents in version_parents_by_mondo_xref.items():
+                for parent in parents:
+                    children_by_mondo_xref.setdefault(parent, []).append(mondo_xref)
+            q = list(reparented_mondo_xrefs)
+            seen = set(q)
+            while q:
+                for child in children_by_mondo_xref.get(q.pop(), []):
+                    if child not in seen:
+                        seen.add(child)
+                        q.append(child)
+            changed_mondo_xrefs |= seen
+
+        return changed_xrefs, changed_names, changed_mondo_xrefs, renamed_mondo_xrefs
 
     def ancestors(self, xref):
-        parents = self.parents_by_mondo_xref.get(xref, [])
-        ret = set(parents)
-        for parent in parents:
-            ret |= self.ancestors(parent)
-        return ret
+        mondo_id = self.mondo_ids.get(xref)
+        if mondo_id == None:
+            return set()
+        ancestor_ids = self.ancestor_ids[self.ancestor_offsets[mondo_id]:self.ancestor_offsets[mondo_id + 1]]
+        return set(map(self.mondo_xrefs.__getitem__, ancestor_ids))
 
     def matches(self, condition_name, xrefs):
         ret = set()
@@ -79,13 +267,18 @@ class Mondo:
 
         return ret
 
+    def has_ancestor(self, mondo_id, ancestor_id):
+        start = self.ancestor_offsets[mondo_id]
+        end = self.ancestor_offsets[mondo_id + 1]
+        i = bisect_left(self.ancestor_ids, ancestor_id, start, end)
+        return i < end and self.ancestor_ids[i] == ancestor_id
+
     def is_descendent_of(self, descendent_xref, ancestor_xref):
-        if descendent_xref not in self.parents_by_mondo_xref:
-            return False #term has no parents
-        for parent_xref in self.parents_by_mondo_xref[descendent_xref]:
-            if parent_xref == ancestor_xref or self.is_descendent_of(parent_xref, ancestor_xref):
-                return True
-        return False
+        descendent_id = self.mondo_ids.get(descendent_xref)
+        ancestor_id = self.mondo_ids.get(ancestor_xref)
+        if descendent_id == None or ancestor_id == None:
+            return False
+        return self.has_ancestor(descendent_id, ancestor_id)
 
     def most_specific_matches(self, condition_name, xrefs):
         matches = list(self.matches(condition_name, xrefs))
@@ -118,64 +311,50 @@ class Mondo:
             i += 1
         return list(matches)
 
+    def is_common_ancestor(self, ancestor_id, mondo_ids):
+        for mondo_id in mondo_ids:
+            if mondo_id != ancestor_id and not self.has_ancestor(mondo_id, ancestor_id):
+                return False
+        return True
+
     def lowest_common_ancestor(self, mondo_xrefs):
-        workable_mondo_xrefs = list(filter(lambda m_id: m_id in self.parents_by_mondo_xref, mondo_xrefs))
-        if len(workable_mondo_xrefs) == 0:
-            return "MONDO:0000001"
+        workable_mondo_ids = list(filter(
+            lambda mondo_id: mondo_id != None and self.parent_offsets[mondo_id] != self.parent_offsets[mondo_id + 1],
+            map(self.mondo_ids.get, mondo_xrefs)
+        ))
+        if len(workable_mondo_ids) == 0:
+            return 'MONDO:0000001'
 
         #check if any in the initial set are the lowest common ancestor
-        for mondo_xref in workable_mondo_xrefs:
-            #check that if all mondo xrefs in list are descendents of this main mondo xref
-            all_equal_or_descendent = True
-            current_mondo_xref = mondo_xref
-            i = 0
-            while i < len(workable_mondo_xrefs):
-                #all workable xrefs must be either equal or descendents of this current mondo xref
-                all_equal_or_descendent &= (
-                    workable_mondo_xrefs[i] == current_mondo_xref or
-                    self.is_descendent_of(workable_mondo_xrefs[i], current_mondo_xref)
-                )
-                if not all_equal_or_descendent:
-                    break
-                i += 1
-            if all_equal_or_descendent:
-                return current_mondo_xref  
-
-        q = []
-        for item in workable_mondo_xrefs: 
-            for parent in self.parents_by_mondo_xref.get(item, []):
-                q.append(parent)
-        if len(q) == 0:
+        for mondo_id in workable_mondo_ids:
+            if self.is_common_ancestor(mondo_id, workable_mondo_ids):
+                return self.mondo_xrefs[mondo_id]
+
+        #then their parents, in order, including the root of the ontology
+        for mondo_id in workable_mondo_ids:
+            for parent_id in self.parent_ids[self.parent_offsets[mondo_id]:self.parent_offsets[mondo_id + 1]]:
+                if self.is_common_ancestor(parent_id, workable_mondo_ids):
+                    return self.mondo_xrefs[parent_id]
+
+        #then the common ancestors that are the fewest generations up from any of the xrefs, within 100 generations,
+        #and alphabetically first if there's a tie. Only use the root of the ontology if no other common ancestors are
+        #found.
+        common_ancestors = None
+        for mondo_id in workable_mondo_ids:
+            start = self.ancestor_offsets[mondo_id]
+            end = self.ancestor_offsets[mondo_id + 1]
+            distances = dict(zip(self.ancestor_ids[start:end], self.ancestor_distances[start:end]))
+            if common_ancestors == None:
+                common_ancestors = distances
+            else:
+                common_ancestors = dict(map(
+                    lambda item: (item[0], min(item[1], distances[item[0]])),
+                    filter(lambda item: item[0] in distances, common_ancestors.items())
+                ))
+        common_ancestors.pop(self.mondo_ids.get('MONDO:0000001'), None)
+        if not common_ancestors:
             return 'MONDO:0000001'
-        gensback = 0
-        while gensback < 100:
-            gensback+=1
-            q_i = 0
-            while len(q) > q_i:
-                #check that if all mondo xrefs in list are descendents of this main mondo xref
-                all_equal_or_descendent = True
-                current_mondo_xref = q[q_i]
-                i = 0
-                while i < len(workable_mondo_xrefs):
-                    #all workable xrefs must be either equal or descendents of this current mondo xref
-                    all_equal_or_descendent &= (
-                        workable_mondo_xrefs[i] == current_mondo_xref or
-                        self.is_descendent_of(workable_mondo_xrefs[i], current_mondo_xref)
-                    )
-                    if not all_equal_or_descendent:
-                        break
-                    i += 1
-                if all_equal_or_descendent:
-                    return current_mondo_xref
-                q_i += 1
-            q2 = set()
-            for item in q:
-                for parent in self.parents_by_mondo_xref.get(item, []):
-                    q2.add(parent)
-            # Only use root of ontology if this isn't the deepest ancestor through all ancestral lines and no other
-            # common ancestors have been found
-            if len(q2) > 0:
-                q2.discard('MONDO:0000001')
-            q = list(q2)
-            q.sort()
-        return 'MONDO:0000001'
+        distance = min(common_ancestors.values())
+        if distance > 100:
+            return 'MONDO:0000001'
+        return self.mondo_xrefs[min(filter(lambda mondo_id: common_ancestors[mondo_id] == distance, common_ancestors))]
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+#time Mondo.lowest_common_ancestor against the generation-by-generation search that it replaced, on the cases from
+#mondo_test_cases.py and on random combinations of terms, and make sure that both give the same answers
+
+from argparse import ArgumentParser
+from mondo import Mondo
+from mondo_test_cases import lowest_common_ancestor_cases
+from random import Random
+from time import perf_counter
+
+def legacy_is_descendent_of(parents_by_mondo_xref, descendent_xref, ancestor_xref):
+    if descendent_xref not in parents_by_mondo_xref:
+        return False #term has no parents
+    for parent_xref in parents_by_mondo_xref[descendent_xref]:
+        if parent_xref == ancestor_xref or legacy_is_descendent_of(parents_by_mondo_xref, parent_xref, ancestor_xref):
+            return True
+    return False
+
+def legacy_lowest_common_ancestor(parents_by_mondo_xref, mondo_xrefs):
+    workable_mondo_xrefs = list(filter(lambda m_id: m_id in parents_by_mondo_xref, mondo_xrefs))
+    if len(workable_mondo_xrefs) == 0:
+        return "MONDO:0000001"
+
+    #check if any in the initial set are the lowest common ancestor
+    for mondo_xref in workable_mondo_xrefs:
+        #check that if all mondo xrefs in list are descendents of this main mondo xref
+        all_equal_or_descendent = True
+        current_mondo_xref = mondo_xref
+        i = 0
+        while i < len(workable_mondo_xrefs):
+            #all workable xrefs must be either equal or descendents of this current mondo xref
+            all_equal_or_descendent &= (
+                workable_mondo_xrefs[i] == current_mondo_xref or
+                legacy_is_descendent_of(parents_by_mondo_xref, workable_mondo_xrefs[i], current_mondo_xref)
+            )
+            if not all_equal_or_descendent:
+                break
+            i += 1
+        if all_equal_or_descendent:
+            return current_mondo_xref
+
+    q = []
+    for item in workable_mondo_xrefs:
+        for parent in parents_by_mondo_xref.get(item, []):
+            q.append(parent)
+    if len(q) == 0:
+        return 'MONDO:0000001'
+    gensback = 0
+    while gensback < 100:
+        gensback+=1
+        q_i = 0
+        while len(q) > q_i:
+            #check that if all mondo xrefs in list are descendents of this main mondo xref
+            all_equal_or_descendent = True
+            current_mondo_xref = q[q_i]
+            i = 0
+            while i < len(workable_mondo_xrefs):
+                #all workable xrefs must be either equal or descendents of this current mondo xref
+                all_equal_or_descendent &= (
+                    workable_mondo_xrefs[i] == current_mondo_xref or
+                    legacy_is_descendent_of(parents_by_mondo_xref, workable_mondo_xrefs[i], current_mondo_xref)
+                )
+                if not all_equal_or_descendent:
+                    break
+                i += 1
+            if all_equal_or_descendent:
+                return current_mondo_xref
+            q_i += 1
+        q2 = set()
+        for item in q:
+            for parent in parents_by_mondo_xref.get(item, []):
+                q2.add(parent)
+        # Only use root of ontology if this isn't the deepest ancestor through all ancestral lines and no other
+        # common ancestors have been found
+        if len(q2) > 0:
+            q2.discard('MONDO:0000001')
+        q = list(q2)
+        q.sort()
+    return 'MONDO:0000001'
+
+def get_random_case(random, children_by_mondo_xref):
+    #submissions usually have terms that are close together in the ontology, so pick terms below a random term
+    ancestor = random.choice(sorted(children_by_mondo_xref))
+    case = []
+    for i in range(random.randint(2, 5)):
+        mondo_xref = ancestor
+        for j in range(random.randint(1, 4)):
+            if mondo_xref not in children_by_mondo_xref:
+                break
+            mondo_xref = random.choice(children_by_mondo_xref[mondo_xref])
+        case.append(mondo_xref)
+    return case
+
+def time_implementation(lowest_common_ancestor, cases, repeat):
+    start_time = perf_counter()
+    for i in range(repeat):
+        results = list(map(lowest_common_ancestor, cases))
+    return results, (perf_counter() - start_time) / (repeat * len(cases))
+
+parser = ArgumentParser(description='Compare the speed and answers of the old and new lowest common ancestor searches')
+parser.add_argument(
+    'mondo_owl', nargs='?', default='mondo.owl', help='the version of Mondo to use (default: mondo.owl)'
+)
+parser.add_argument(
+    '--random', type=int, default=1000, metavar='N',
+    help='number of random combinations of 2 to 5 related terms to add to the tested cases (default: 1000)'
+)
+parser.add_argument(
+    '--repeat', type=int, default=3, metavar='N', help='number of times to run each implementation (default: 3)'
+)
+args = parser.parse_args()
+
+mondo = Mondo(args.mondo_owl)
+parents_by_mondo_xref = mondo.get_parents_by_mondo_xref()
+
+children_by_mondo_xref = {}
+for mondo_xref, parents in sorted(parents_by_mondo_xref.items()):
+    for parent in parents:
+        children_by_mondo_xref.setdefault(parent, []).append(mondo_xref)
+random = Random(0)
+cases = list(map(lambda case: case[0], lowest_common_ancestor_cases))
+for i in range(args.random):
+    cases.append(get_random_case(random, children_by_mondo_xref))
+
+legacy_results, legacy_seconds = time_implementation(
+    lambda mondo_xrefs: legacy_lowest_common_ancestor(parents_by_mondo_xref, mondo_xrefs), cases, args.repeat
+)
+results, seconds = time_implementation(mondo.lowest_common_ancestor, cases, args.repeat)
+
+print(f'Old search: {legacy_seconds * 1000000:.1f} µs per case')
+print(f'New search: {seconds * 1000000:.1f} µs per case')
+print(f'{legacy_seconds / seconds:.1f}x faster')
+
+mismatches = list(filter(lambda i: results[i] != legacy_results[i], range(len(cases))))
+for i in mismatches:
+    print(f'{", ".join(cases[i])}: {legacy_results[i]} before, {results[i]} now')
+print(f'{len(mismatches)} of {len(cases)} cases have different answers')
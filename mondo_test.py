@@ -9,7 +9,9 @@
 # choreatic disease - MONDO:0001595
 
 import unittest
-from mondo import Mondo
+from copy import copy
+from mondo import Mondo, cached_attributes
+from mondo_test_cases import lowest_common_ancestor_cases
 
 mon = Mondo()
 
@@ -18,10 +20,6 @@ for key, value in mon.xref_to_mondo_xref.items():
     mondo_xref_to_xref[value] = key
 
 class MondoTestCases(unittest.TestCase):
-    def test_common_ancestor(self):
-        result = mon.lowest_common_ancestor(['MONDO:0005546', 'MONDO:0100094'])
-        self.assertEqual(result, 'MONDO:0002254')
-
     def test_is_descendent_of(self):
         #DIRECT CHILD. should be true: disease involving pain > fibromyalgia
         self.assertTrue(mon.is_descendent_of('MONDO:0100094', 'MONDO:0021668'))
@@ -125,77 +123,30 @@ class MondoTestCases(unittest.TestCase):
         self.assertEqual(mons, set(['MONDO:0007325']))
 
     def test_lowest_common_ancestor(self):
-        #direct children
-        self.assertEqual(
-            'MONDO:0001214',
-            mon.lowest_common_ancestor(['MONDO:0001224', 'MONDO:0001226', 'MONDO:0005634'])
-        )
-        #multiple children and indirect ancestors
-        self.assertEqual(
-            'MONDO:0020683',
-            mon.lowest_common_ancestor(['MONDO:0001224', 'MONDO:0001226', 'MONDO:0005634', 'MONDO:0001817'])
-        )
-        #common ancestor in list
-        self.assertEqual(
-            'MONDO:0001214',
-            mon.lowest_common_ancestor(['MONDO:0001224','MONDO:0001214'])
-        )
-        #offset deep children
-        self.assertEqual(
-            'MONDO:0000001',
-            mon.lowest_common_ancestor(['MONDO:0043079','MONDO:0027751'])
-        )
-        #one term is close to the root, but we want to avoid using the root
-        self.assertEqual(
-            'MONDO:0002602',
-            mon.lowest_common_ancestor(['MONDO:0007103', 'MONDO:0008201'])
-        )
-
-    def test_lowest_common_ancestor_extras(self):
-        xrefs = [
-            'HP:0001263',
-            'HP:0001270',
-            'HP:0001344',
-            'HP:0002126',
-            'HP:0002194',
-            'HP:0002273',
-            'HP:0002518',
-            'HP:0007204',
-            'HP:0008936',
-            'HP:0009062',
-            'HP:0100021',
-            'MONDO:0000087',
-            'MONDO:0006497',
-            'UMLS:C0007789',
-            'UMLS:C0266464',
-            'UMLS:C0270790',
-            'UMLS:C0557874',
-            'UMLS:C1837658',
-            'UMLS:C1853743',
-            'UMLS:C1854301',
-            'UMLS:C1854882',
-            'UMLS:C2673431',
-            'UMLS:C3806604',
-            'UMLS:C4024923',
-        ]
-        self.assertEqual('MONDO:0002602', mon.lowest_common_ancestor(xrefs))
-
-    def test_lowest_common_ancestor_extras2(self):
-        xrefs = [
-            'MONDO:0008810',
-            'OMIM:207750',
-            'OMIM:608083.0002',
-            'OMIM:608083.0003',
-            'OMIM:608083.0004',
-            'OMIM:608083.0005',
-            'OMIM:608083.0006',
-            'OMIM:608083.0007',
-            'OMIM:608083.0008',
-            'OMIM:608083.0011',
-            'OMIM:608083.0012',
-            'ORPHANET:444490',
-            'UMLS:C1720779',
-        ]
-        self.assertEqual('MONDO:0008810', mon.lowest_common_ancestor(xrefs))
+        for mondo_xrefs, expected in lowest_common_ancestor_cases:
+            with self.subTest(mondo_xrefs=mondo_xrefs):
+                self.assertEqual(expected, mon.lowest_common_ancestor(mondo_xrefs))
+
+    def test_cache(self):
+        #loading from mondo.owl.pickle gives the same Mondo as parsing mondo.owl
+        parsed_mon = Mondo(use_cache=False)
+        cached_mon = Mondo()
+        for name in cached_attributes:
+            self.assertEqual(getattr(parsed_mon, name), getattr(cached_mon, name))
+
+    def test_changes_since(self):
+        self.assertEqual((set(), set(), set(), set()), mon.changes_since(mon))
+
+        #moving disease involving pain changes the ancestors of fibromyalgia and cannabinoid hyperemesis syndrome too
+        new_mon = copy(mon)
+        parents_by_mondo_xref = mon.get_parents_by_mondo_xref()
+        parents_by_mondo_xref['MONDO:0021668'] = ['MONDO:0000001']
+        new_mon.index_ancestors(parents_by_mondo_xref)
+        changed_xrefs, changed_names, changed_mondo_xrefs, renamed_mondo_xrefs = new_mon.changes_since(mon)
+        self.assertEqual(set(), changed_xrefs)
+        self.assertEqual(set(), changed_names)
+        self.assertTrue({'MONDO:0021668', 'MONDO:0005546', 'MONDO:0100094'} <= changed_mondo_xrefs)
+        self.assertNotIn('MONDO:0007038', changed_mondo_xrefs)
+        self.assertEqual(set(), renamed_mondo_xrefs)
 
 unittest.main()
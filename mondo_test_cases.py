@@ -0,0 +1,64 @@
+#lists of xrefs and their lowest common Mondo ancestors, shared by mondo_test.py and mondo_benchmark.py
+
+lowest_common_ancestor_cases = [
+    #fibromyalgia and cannabinoid hyperemesis syndrome
+    (['MONDO:0005546', 'MONDO:0100094'], 'MONDO:0002254'),
+    #direct children
+    (['MONDO:0001224', 'MONDO:0001226', 'MONDO:0005634'], 'MONDO:0001214'),
+    #multiple children and indirect ancestors
+    (['MONDO:0001224', 'MONDO:0001226', 'MONDO:0005634', 'MONDO:0001817'], 'MONDO:0020683'),
+    #common ancestor in list
+    (['MONDO:0001224', 'MONDO:0001214'], 'MONDO:0001214'),
+    #offset deep children
+    (['MONDO:0043079', 'MONDO:0027751'], 'MONDO:0000001'),
+    #one term is close to the root, but we want to avoid using the root
+    (['MONDO:0007103', 'MONDO:0008201'], 'MONDO:0002602'),
+    #extras
+    (
+        [
+            'HP:0001263',
+            'HP:0001270',
+            'HP:0001344',
+            'HP:0002126',
+            'HP:0002194',
+            'HP:0002273',
+            'HP:0002518',
+            'HP:0007204',
+            'HP:0008936',
+            'HP:0009062',
+            'HP:0100021',
+            'MONDO:0000087',
+            'MONDO:0006497',
+            'UMLS:C0007789',
+            'UMLS:C0266464',
+            'UMLS:C0270790',
+            'UMLS:C0557874',
+            'UMLS:C1837658',
+            'UMLS:C1853743',
+            'UMLS:C1854301',
+            'UMLS:C1854882',
+            'UMLS:C2673431',
+            'UMLS:C3806604',
+            'UMLS:C4024923',
+        ],
+        'MONDO:0002602',
+    ),
+    (
+        [
+            'MONDO:0008810',
+            'OMIM:207750',
+            'OMIM:608083.0002',
+            'OMIM:608083.0003',
+            'OMIM:608083.0004',
+            'OMIM:608083.0005',
+            'OMIM:608083.0006',
+            'OMIM:608083.0007',
+            'OMIM:608083.0008',
+            'OMIM:608083.0011',
+            'OMIM:608083.0012',
+            'ORPHANET:444490',
+            'UMLS:C1720779',
+        ],
+        'MONDO:0008810',
+    ),
+]
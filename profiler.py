@@ -0,0 +1,144 @@
+#measure what each stage of a long job costs and keep a record of it in the database, so that a stage that gets slower
+#or bigger from one month's import to the next stands out
+
+from contextlib import contextmanager
+from datetime import datetime
+from psutil import AccessDenied, NoSuchProcess, Process
+from threading import Event, Thread
+from time import perf_counter
+
+#how many seconds to wait between measurements of the memory that the job is using
+sample_interval = 1
+
+def get_memory_used(process):
+    #proportional set sizes add up to the memory actually used by a process and its children because pages that they
+    #share are split between them; resident set sizes are used where PSS isn't available
+    memory_used = 0
+    for process in [process] + process.children(recursive=True):
+        try:
+            memory_info = process.memory_full_info()
+        except (AccessDenied, NoSuchProcess):
+            continue
+        memory_used += getattr(memory_info, 'pss', memory_info.rss)
+    return memory_used
+
+def get_cpu_times(process):
+    #the CPU time of this process, and of all of its children including the ones that have already exited
+    times = process.cpu_times()
+    children_time = times.children_user + times.children_system
+    for child in process.children(recursive=True):
+        try:
+            child_times = child.cpu_times()
+        except (AccessDenied, NoSuchProcess):
+            continue
+        children_time += child_times.user + child_times.system
+    return times.user + times.system, children_time
+
+def get_bytes_written(process):
+    try:
+        return process.io_counters().write_bytes
+    except (AccessDenied, AttributeError): #not available on every platform
+        return None
+
+def create_profile_table(db):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS stage_profiles (
+            started TEXT,
+            job TEXT,
+            date TEXT,
+            stage TEXT,
+            wall_seconds REAL,
+            cpu_seconds REAL,
+            children_cpu_seconds REAL,
+            peak_memory INTEGER,
+            rows_in INTEGER,
+            rows_out INTEGER,
+            pages_written INTEGER
+        )
+    ''')
+
+class Stage:
+    def __init__(self, name, date):
+        self.name = name
+        self.date = date
+        self.rows_in = None #set by the stage
+        self.rows_out = None
+        self.skipped = False #set by the stage if it turned out that there was nothing to do
+
+class Profiler:
+    def __init__(self, job, db):
+        self.job = job
+        self.started = datetime.now().isoformat(' ', 'seconds')
+        self.page_size = list(db.execute('PRAGMA page_size'))[0][0]
+        self.process = Process()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, date=None):
+        stage = Stage(name, date)
+        stage.peak_memory = get_memory_used(self.process)
+        stopped = Event()
+
+        def sample():
+            while not stopped.wait(sample_interval):
+                stage.peak_memory = max(stage.peak_memory, get_memory_used(self.process))
+
+        sampler = Thread(target=sample, daemon=True)
+        sampler.start()
+        start_time = perf_counter()
+        start_cpu_seconds, start_children_cpu_seconds = get_cpu_times(self.process)
+        start_bytes_written = get_bytes_written(self.process)
+        try:
+            yield stage
+        finally:
+            stopped.set()
+            sampler.join()
+
+        stage.wall_seconds = perf_counter() - start_time
+        cpu_seconds, children_cpu_seconds = get_cpu_times(self.process)
+        stage.cpu_seconds = cpu_seconds - start_cpu_seconds
+        stage.children_cpu_seconds = children_cpu_seconds - start_children_cpu_seconds
+        stage.peak_memory = max(stage.peak_memory, get_memory_used(self.process))
+        bytes_written = get_bytes_written(self.process)
+        if bytes_written != None and start_bytes_written != None:
+            stage.pages_written = (bytes_written - start_bytes_written) // self.page_size
+        else:
+            stage.pages_written = None
+        if not stage.skipped:
+            self.stages.append(stage)
+
+    def report(self):
+        #children's CPU time is the time spent in the worker processes, such as parsing while this process inserts
+        width = max(map(lambda stage: len(stage.name), self.stages), default=0)
+        print(
+            f'{"Stage":<{width}} {"Wall s":>8} {"CPU s":>8} {"Workers s":>9} {"Peak MB":>8} {"Rows in":>10} '
+            f'{"Rows out":>10} {"Pages":>9}'
+        )
+        for stage in self.stages:
+            print(
+                f'{stage.name:<{width}} {stage.wall_seconds:8.1f} {stage.cpu_seconds:8.1f} '
+                f'{stage.children_cpu_seconds:9.1f} {stage.peak_memory // (1024 * 1024):8} '
+                f'{"" if stage.rows_in == None else stage.rows_in:>10} '
+                f'{"" if stage.rows_out == None else stage.rows_out:>10} '
+                f'{"" if stage.pages_written == None else stage.pages_written:>9}'
+            )
+
+    def save(self, db):
+        create_profile_table(db)
+        db.executemany('INSERT INTO stage_profiles VALUES (?,?,?,?,?,?,?,?,?,?,?)', map(
+            lambda stage: (
+                self.started,
+                self.job,
+                stage.date,
+                stage.name,
+                stage.wall_seconds,
+                stage.cpu_seconds,
+                stage.children_cpu_seconds,
+                stage.peak_memory,
+                stage.rows_in,
+                stage.rows_out,
+                stage.pages_written,
+            ),
+            self.stages
+        ))
+        db.commit()
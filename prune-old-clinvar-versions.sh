@@ -2,7 +2,20 @@
 
 echo Pruning old ClinVar versions
 year=$(date +%Y)
-for table in submissions comparisons mondo_clinvar_relationships; do
-    # echo "DELETE FROM $table WHERE date NOT LIKE '$year-%' AND date NOT LIKE '%-12-%'" | sqlite3 clinvar.db
-    echo "DELETE FROM $table WHERE date != (SELECT MAX(date) FROM submissions)" | sqlite3 clinvar.db
+for table in submissions comparisons mondo_clinvar_relationships clinvarset_digests import_progress gene_links normalized_gene_links; do
+    # echo "DELETE FROM $table WHERE date NOT LIKE '$year-%' AND date NOT LIKE '%-12-%'" | sqlite3 ${CLINVAR_DB:-clinvar.db}
+    echo "DELETE FROM $table WHERE date != (SELECT MAX(date) FROM submissions)" | sqlite3 ${CLINVAR_DB:-clinvar.db}
+done
+
+# Only the releases that are still in the database can be rederived, so their
+# parsed releases are the only ones worth keeping
+parsed=${PARSED_RELEASES:-parsed-releases}
+dates=$(echo "SELECT DISTINCT date FROM submissions" | sqlite3 ${CLINVAR_DB:-clinvar.db})
+for filename in $parsed/ClinVarParsedRelease_*.pickle.gz; do
+    [ -f "$filename" ] || continue
+    date=$(basename $filename .pickle.gz)
+    date=${date#ClinVarParsedRelease_}
+    if ! echo "$dates" | grep -qx "$date"; then
+        rm "$filename"
+    fi
 done
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+#update the Mondo columns of every release in the database after mondo.owl changes, only touching the rows that the
+#changes to Mondo could affect
+
+from argparse import ArgumentParser
+from functools import lru_cache
+from mondo import Mondo
+from sys import exit
+from time import perf_counter
+
+importer = __import__('import-clinvar-xml')
+mondo = importer.mondo
+
+def is_affected(condition_name, condition_xrefs, changes, old_mondo):
+    changed_xrefs, changed_names, changed_mondo_xrefs, renamed_mondo_xrefs = changes
+    if condition_name.lower() in changed_names:
+        return True
+    xrefs = set(filter(None, condition_xrefs.split(';')))
+    if xrefs & changed_xrefs or xrefs & changed_mondo_xrefs:
+        return True
+    #a match that was dropped because it was less specific than another match could now be the most specific one
+    return bool(old_mondo.matches(condition_name, xrefs) & changed_mondo_xrefs)
+
+def remap_condition_xrefs(condition_name, condition_xrefs):
+    #ClinVar itself never gives MONDO xrefs, so those are the ones that were added by matching
+    xrefs = set(filter(lambda xref: xref and not xref.startswith('MONDO:'), condition_xrefs.split(';')))
+    return ';'.join(sorted(xrefs | mondo.most_specific_matches(condition_name, xrefs)))
+
+@lru_cache(maxsize=None)
+def get_primary_mondo_xref(condition_xrefs):
+    mondo_xrefs = list(filter(lambda ref: ref.startswith('MONDO:'), condition_xrefs.split(';')))
+    return mondo.lowest_common_ancestor(mondo_xrefs)
+
+def remap_release(cursor, date):
+    #every submission of a variant is needed to redo the variant's descendent Mondo xref fixes
+    cursor.execute('DELETE FROM remapped_variants')
+    cursor.execute('''
+        INSERT OR IGNORE INTO remapped_variants
+        SELECT variant_name FROM submissions s INNER JOIN remapped_conditions r
+        ON s.condition_name=r.condition_name AND s.condition_xrefs=r.old_condition_xrefs
+        WHERE s.date=?
+    ''', [date])
+
+    cursor.execute('DELETE FROM remapped_names')
+    cursor.execute('''
+        INSERT OR IGNORE INTO remapped_names
+        SELECT condition_name FROM submissions
+        WHERE date=? AND variant_name IN (SELECT variant_name FROM remapped_variants)
+    ''', [date])
+    cursor.execute('''
+        INSERT OR IGNORE INTO remapped_names
+        SELECT clinvar_name FROM mondo_clinvar_relationships
+        WHERE date=? AND mondo_id IN (SELECT mondo_id FROM remapped_terms)
+    ''', [date])
+
+    cursor.execute('''
+        UPDATE submissions
+        SET condition_xrefs=(
+            SELECT condition_xrefs FROM remapped_conditions r
+            WHERE r.condition_name=submissions.condition_name AND r.old_condition_xrefs=submissions.condition_xrefs
+        )
+        WHERE date=? AND variant_name IN (SELECT variant_name FROM remapped_variants) AND EXISTS (
+            SELECT 1 FROM remapped_conditions r
+            WHERE r.condition_name=submissions.condition_name AND r.old_condition_xrefs=submissions.condition_xrefs
+        )
+    ''', [date])
+
+    rows = list(map(
+        lambda row: (row[0], row[1], get_primary_mondo_xref(row[2])),
+        cursor.execute('''
+            SELECT variant_name, scv, condition_xrefs FROM submissions
+            WHERE date=? AND variant_name IN (SELECT variant_name FROM remapped_variants)
+            ORDER BY variant_name, scv
+        ''', [date])
+    ))
+    fixes = dict(importer.get_primary_mondo_xref_fixes(rows))
+
+    cursor.execute('DELETE FROM remapped_submissions')
+    cursor.executemany(
+        'INSERT INTO remapped_submissions VALUES (?,?,?)',
+        map(lambda row: (row[1], row[2], fixes.get(row[1], row[2])), rows)
+    )
+
+    #clinvarset_digests keeps the xref from before the fixes for --delta to copy forward
+    cursor.execute('''
+        UPDATE clinvarset_digests
+        SET primary_mondo_xref=(
+            SELECT unfixed_primary_mondo_xref FROM remapped_submissions WHERE scv=clinvarset_digests.scv
+        )
+        WHERE date=? AND scv IN (SELECT scv FROM remapped_submissions)
+    ''', [date])
+    cursor.execute('''
+        UPDATE submissions
+        SET primary_mondo_xref=(SELECT primary_mondo_xref FROM remapped_submissions WHERE scv=submissions.scv)
+        WHERE date=? AND scv IN (SELECT scv FROM remapped_submissions)
+    ''', [date])
+
+    #comparisons are only made between submissions of the same variant, so both sides have been remapped
+    cursor.execute('''
+        UPDATE comparisons
+        SET
+            condition1_xrefs=(
+                SELECT condition_xrefs FROM submissions WHERE date=comparisons.date AND scv=comparisons.scv1
+            ),
+            primary_mondo_xref1=(SELECT primary_mondo_xref FROM remapped_submissions WHERE scv=comparisons.scv1),
+            primary_mondo_xref2=(SELECT primary_mondo_xref FROM remapped_submissions WHERE scv=comparisons.scv2)
+        WHERE date=? AND scv1 IN (SELECT scv FROM remapped_submissions)
+    ''', [date])
+    cursor.execute('''
+        UPDATE comparisons
+        SET normalized_conflict_level=(
+            CASE WHEN primary_mondo_xref1=primary_mondo_xref2 THEN conflict_level ELSE -1 END
+        )
+        WHERE date=? AND scv1 IN (SELECT scv FROM remapped_submissions)
+    ''', [date])
+
+    cursor.execute('''
+        DELETE FROM mondo_clinvar_relationships
+        WHERE date=? AND clinvar_name IN (SELECT condition_name FROM remapped_names)
+    ''', [date])
+    for row in list(cursor.execute('''
+        SELECT DISTINCT condition_name, condition_xrefs FROM submissions
+        WHERE date=? AND condition_name IN (SELECT condition_name FROM remapped_names)
+    ''', [date])):
+        cursor.executemany(
+            'INSERT OR REPLACE INTO mondo_clinvar_relationships VALUES (?,?,?,?)',
+            importer.get_mondo_relationships(date, row[0], row[1])
+        )
+
+    return len(rows)
+
+parser = ArgumentParser(description='Update the Mondo columns of clinvar.db (or $CLINVAR_DB) to match mondo.owl')
+parser.add_argument(
+    'old_mondo_owl', nargs='?', default='mondo.owl.built',
+    help='the version of Mondo that the database was built with (default: mondo.owl.built)'
+)
+args = parser.parse_args()
+
+start_time = perf_counter()
+old_mondo = Mondo(args.old_mondo_owl)
+changes = mondo.changes_since(old_mondo)
+changed_xrefs, changed_names, changed_mondo_xrefs, renamed_mondo_xrefs = changes
+print(
+    f'{len(changed_xrefs)} xrefs and {len(changed_names)} names were matched differently, the ancestors of '
+    f'{len(changed_mondo_xrefs)} Mondo terms changed and {len(renamed_mondo_xrefs)} Mondo terms were renamed'
+)
+if not any(changes):
+    exit()
+
+db = importer.connect()
+cursor = db.cursor()
+
+cursor.execute('''
+    CREATE TEMP TABLE remapped_conditions (
+        condition_name TEXT,
+        old_condition_xrefs TEXT,
+        condition_xrefs TEXT,
+        PRIMARY KEY (condition_name, old_condition_xrefs)
+    )
+''')
+cursor.execute('CREATE TEMP TABLE remapped_terms (mondo_id INTEGER PRIMARY KEY)')
+cursor.execute('CREATE TEMP TABLE remapped_variants (variant_name TEXT PRIMARY KEY)')
+cursor.execute('CREATE TEMP TABLE remapped_names (condition_name TEXT PRIMARY KEY)')
+cursor.execute('''
+    CREATE TEMP TABLE remapped_submissions (
+        scv INTEGER PRIMARY KEY,
+        unfixed_primary_mondo_xref TEXT,
+        primary_mondo_xref TEXT
+    )
+''')
+
+cursor.executemany(
+    'INSERT INTO remapped_terms VALUES (?)',
+    map(lambda xref: [int(xref[len('MONDO:'):])], changed_mondo_xrefs | renamed_mondo_xrefs)
+)
+
+conditions = list(cursor.execute('SELECT DISTINCT condition_name, condition_xrefs FROM submissions'))
+for condition_name, condition_xrefs in conditions:
+    if is_affected(condition_name, condition_xrefs, changes, old_mondo):
+        cursor.execute(
+            'INSERT INTO remapped_conditions VALUES (?,?,?)',
+            [condition_name, condition_xrefs, remap_condition_xrefs(condition_name, condition_xrefs)]
+        )
+
+dates = list(map(lambda row: row[0], cursor.execute('SELECT DISTINCT date FROM submissions ORDER BY date')))
+for date in dates:
+    print(f'Remapped {remap_release(cursor, date)} submissions from {date}')
+    db.commit()
+
+db.close()
+
+print(f'Remapped {len(dates)} releases in {perf_counter() - start_time:.1f} seconds')
@@ -0,0 +1,69 @@
+#parse XML with lxml if it's installed and with Python's own ElementTree if it isn't. Both backends build trees of
+#elements with the same text, attrib and get, but elements should only be searched through the backend's find and
+#findall because lxml runs compiled XPath much faster than it runs ElementTree's paths.
+
+from xml.etree import ElementTree
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+class ElementTreeBackend:
+    name = 'etree'
+
+    def fromstring(self, xml):
+        return ElementTree.fromstring(xml)
+
+    def parse(self, source):
+        return ElementTree.parse(source).getroot()
+
+    def iterparse(self, source, events):
+        return ElementTree.iterparse(source, events)
+
+    def find(self, el, path, namespaces=None):
+        return el.find(path, namespaces)
+
+    def findall(self, el, path, namespaces=None):
+        return el.findall(path, namespaces)
+
+class LxmlBackend:
+    name = 'lxml'
+
+    def __init__(self):
+        #ElementTree has no limits on the size of a document or its text and doesn't keep comments, so neither should
+        #lxml
+        self.parser = etree.XMLParser(huge_tree=True, remove_comments=True, remove_pis=True, resolve_entities=False)
+        self.xpaths = {}
+
+    def fromstring(self, xml):
+        return etree.fromstring(xml, self.parser)
+
+    def parse(self, source):
+        return etree.parse(source, self.parser).getroot()
+
+    def iterparse(self, source, events):
+        return etree.iterparse(
+            source, events, huge_tree=True, remove_comments=True, remove_pis=True, resolve_entities=False
+        )
+
+    def xpath(self, path, namespaces):
+        #each path is only compiled once, so it must always be used with the same namespaces
+        xpath = self.xpaths.get(path)
+        if xpath == None:
+            xpath = etree.XPath(path, namespaces=namespaces)
+            self.xpaths[path] = xpath
+        return xpath
+
+    def find(self, el, path, namespaces=None):
+        els = self.xpath(path, namespaces)(el)
+        return els[0] if els else None
+
+    def findall(self, el, path, namespaces=None):
+        return self.xpath(path, namespaces)(el)
+
+backends = {'etree': ElementTreeBackend()}
+if etree != None:
+    backends['lxml'] = LxmlBackend()
+
+default_backend = backends['lxml'] if 'lxml' in backends else backends['etree']